@@ -0,0 +1,79 @@
+"""Compare decode_batches with the DataFrame-of-dicts path on raw BSON.
+
+Run with ``python -m benchmarks.bson_decode``. Documents shaped like the
+flattened sample projection are encoded into raw batches up front, so both
+paths decode the same bytes a cursor would receive and no server is needed.
+"""
+import argparse
+import datetime
+import time
+
+import bson
+import numpy as np
+import pandas as pd
+
+from results_dashboard.data.decode import decode_batches
+from results_dashboard.data.store import SAMPLE_FIELDS
+
+
+def make_batches(docs: int, batch_size: int, sensors: int, seed: int) -> list[bytes]:
+    rng = np.random.default_rng(seed)
+    start = datetime.datetime(2023, 1, 1)
+    names = [f"TS-{i}" for i in range(sensors)]
+    batches = []
+    for first in range(0, docs, batch_size):
+        count = min(batch_size, docs - first)
+        values = rng.normal(size=(count, len(SAMPLE_FIELDS) - 2)).tolist()
+        batch = bytearray()
+        for i in range(count):
+            doc = {
+                "sample_time": start
+                + datetime.timedelta(seconds=(first + i) // sensors),
+                "sensor_name": names[(first + i) % sensors],
+            }
+            numeric = (c for c in SAMPLE_FIELDS if c not in doc)
+            doc.update(zip(numeric, values[i]))
+            batch += bson.encode(doc)
+        batches.append(bytes(batch))
+    return batches
+
+
+def dict_path(batches: list[bytes]) -> pd.DataFrame:
+    """pd.DataFrame(list(cursor)), as SensorData did before decode_batches."""
+    docs = []
+    for batch in batches:
+        docs.extend(bson.decode_all(batch))
+    return pd.DataFrame(docs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--sensors", type=int, default=24)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    batches = make_batches(args.docs, args.batch_size, args.sensors, args.seed)
+
+    start = time.perf_counter()
+    expected = dict_path(batches)
+    legacy = time.perf_counter() - start
+
+    start = time.perf_counter()
+    df = decode_batches(batches, SAMPLE_FIELDS)
+    columnar = time.perf_counter() - start
+
+    matches = df.astype({"sensor_name": object}).equals(expected[list(SAMPLE_FIELDS)])
+    legacy_mb = expected.memory_usage(deep=True).sum() / 2**20
+    columnar_mb = df.memory_usage(deep=True).sum() / 2**20
+
+    print(f"documents: {args.docs:,} in {len(batches):,} batches")
+    print(f"dict path:       {legacy:8.3f} s {legacy_mb:10.1f} MiB")
+    print(f"decode_batches:  {columnar:8.3f} s {columnar_mb:10.1f} MiB")
+    print(f"speedup:         {legacy / columnar:8.1f}x")
+    print(f"results match:   {matches}")
+
+
+if __name__ == "__main__":
+    main()
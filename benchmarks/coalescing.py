@@ -0,0 +1,174 @@
+"""Count the queries concurrent sessions on one selection issue.
+
+Run with ``python -m benchmarks.coalescing``. For each number of sessions,
+that many threads open the same synthetic test together and each calls the
+same SensorData methods from an empty result cache, as a page does. The run
+is repeated with ``cache.COALESCE`` off and on; with coalescing the query
+and computation counts should stay flat as sessions are added.
+
+Queries are counted with a pymongo command listener against a server given
+with ``--uri``, or by wrapping mongomock's ``find`` and ``aggregate`` with
+``--mock``. mongomock lacks some of the aggregation operators, so use
+``--source store`` with it.
+"""
+import argparse
+import json
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import pymongo
+from pymongo import monitoring
+
+from results_dashboard.data import SensorData, cache, perf
+from results_dashboard.data.cache import sensor_cache
+from results_dashboard.data.mongo import mongo_tilt_db, use_client
+from results_dashboard.data.store import sample_store
+
+from .sensor_data import METHODS
+from .synthetic import DatasetSpec, load, unload
+
+QUERY_COMMANDS = {"aggregate", "find", "count", "distinct", "getMore"}
+
+
+class QueryCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def add(self) -> None:
+        with self._lock:
+            self.count += 1
+
+    def started(self, event):
+        if event.command_name in QUERY_COMMANDS:
+            self.add()
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def count_mock_queries(counter: QueryCounter) -> None:
+    """Count mongomock's queries, which don't fire command events."""
+    import mongomock
+
+    for name in ("find", "aggregate"):
+        method = getattr(mongomock.collection.Collection, name)
+
+        def counted(*args, _method=method, **kwargs):
+            counter.add()
+            return _method(*args, **kwargs)
+
+        setattr(mongomock.collection.Collection, name, counted)
+
+
+def run_sessions(test_ids: list[str], sessions: int, methods: list[str], counter):
+    """Run ``sessions`` concurrent sessions and count what they cost."""
+    sensor_cache.clear()
+    counter.count = 0
+    barrier = threading.Barrier(sessions)
+    runs = [None] * sessions
+    errors = []
+
+    def session(index: int):
+        data = SensorData(test_ids)
+        barrier.wait()
+        runs[index] = perf.start_run(f"session {index}")
+        try:
+            for name in methods:
+                METHODS[name](data)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+
+    threads = [
+        threading.Thread(target=session, args=(i,), daemon=True)
+        for i in range(sessions)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    spans = [s for run in runs if run for s in run.spans]
+    return {
+        "sessions": sessions,
+        "seconds": seconds,
+        "queries": counter.count,
+        "computed": sum(s.cache == "miss" for s in spans),
+        "shared": sum(s.cache == "shared" for s in spans),
+        "hits": sum(s.cache == "hit" for s in spans),
+        "errors": sorted(set(errors)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", default="1,2,4,8,16")
+    parser.add_argument("--samples", type=int, default=200_000)
+    parser.add_argument("--tests", type=int, default=1)
+    parser.add_argument("--sensors", type=int, default=24)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--mock", action="store_true")
+    parser.add_argument("--source", choices=["mongo", "store"], default="mongo")
+    parser.add_argument(
+        "--methods",
+        nargs="+",
+        choices=list(METHODS),
+        default=["linearity", "accuracy", "repeatability"],
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=Path("coalescing.json"))
+    args = parser.parse_args()
+
+    perf.PERF_LOG = False
+    counter = QueryCounter()
+    if args.mock:
+        import mongomock
+
+        count_mock_queries(counter)
+        use_client(mongomock.MongoClient())
+    else:
+        use_client(pymongo.MongoClient(args.uri, event_listeners=[counter]))
+
+    store_dir = tempfile.TemporaryDirectory()
+    sample_store.enabled = args.source == "store"
+    sample_store.path = Path(store_dir.name)
+
+    spec = DatasetSpec(
+        samples=args.samples, tests=args.tests, sensors=args.sensors, seed=args.seed
+    )
+    db = mongo_tilt_db()
+    test_ids = load(db, spec)
+    results = {"samples": args.samples, "source": args.source, "runs": []}
+    try:
+        if args.source == "store":
+            # the store syncs once per test whatever the load; leave it out
+            for test_id in test_ids:
+                sample_store.sync(test_id)
+
+        print(f"{'coalesce':>8} {'sessions':>8} {'queries':>8} {'computed':>8}")
+        for coalesce in (False, True):
+            cache.COALESCE = coalesce
+            for sessions in map(int, args.sessions.split(",")):
+                run = run_sessions(test_ids, sessions, args.methods, counter)
+                results["runs"].append({"coalesce": coalesce, **run})
+                print(
+                    f"{str(coalesce):>8} {sessions:>8} {run['queries']:>8} "
+                    f"{run['computed']:>8}  {run['seconds']:.2f} s"
+                    + (f"  {run['errors']}" if run["errors"] else "")
+                )
+    finally:
+        unload(db, test_ids)
+        store_dir.cleanup()
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
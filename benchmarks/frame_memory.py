@@ -0,0 +1,92 @@
+"""Compare the memory of SensorData frames with and without compact dtypes.
+
+Run with ``python -m benchmarks.frame_memory``. A synthetic dataset is
+loaded into mongomock (or the server given with ``--uri``) and served from a
+temporary sample store, then every method is run with
+``schema.COMPACT_FRAMES`` off and on. Reported sizes are
+``memory_usage(deep=True)``, so object strings are counted in full.
+"""
+import argparse
+import json
+import tempfile
+from pathlib import Path
+
+import pymongo
+
+from results_dashboard.data import SensorData, schema
+from results_dashboard.data.cache import sensor_cache
+from results_dashboard.data.mongo import mongo_tilt_db, use_client
+from results_dashboard.data.store import sample_store
+
+from .sensor_data import METHODS
+from .synthetic import DatasetSpec, load, unload
+
+REPORTED = {
+    **METHODS,
+    "linearity(zeroed, series)": lambda data: data.linearity(True, True),
+    "linearity_fit": lambda data: data.linearity_fit(),
+    "repeatability(zeroed, series)": lambda data: data.repeatability(True, True),
+}
+
+
+def frame_bytes(value) -> int:
+    return int(value.memory_usage(deep=True).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--samples", type=int, default=1_000_000)
+    parser.add_argument("--tests", type=int, default=2)
+    parser.add_argument("--sensors", type=int, default=24)
+    parser.add_argument("--uri")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    if args.uri:
+        use_client(pymongo.MongoClient(args.uri))
+    else:
+        import mongomock
+
+        use_client(mongomock.MongoClient())
+    store_dir = tempfile.TemporaryDirectory()
+    sample_store.enabled = True
+    sample_store.path = Path(store_dir.name)
+
+    spec = DatasetSpec(
+        samples=args.samples, tests=args.tests, sensors=args.sensors, seed=args.seed
+    )
+    db = mongo_tilt_db()
+    test_ids = load(db, spec)
+    report = {}
+    try:
+        for test_id in test_ids:
+            sample_store.sync(test_id)
+        data = SensorData(test_ids)
+        cached = {}
+        for compact in (False, True):
+            schema.COMPACT_FRAMES = compact
+            sensor_cache.clear()
+            for name, method in REPORTED.items():
+                report.setdefault(name, {})[
+                    "compact" if compact else "legacy"
+                ] = frame_bytes(method(data))
+            cached["compact" if compact else "legacy"] = sensor_cache.stats()["bytes"]
+        report["result cache"] = cached
+    finally:
+        unload(db, test_ids)
+        store_dir.cleanup()
+
+    print(f"{'method':>32} {'legacy MiB':>11} {'compact MiB':>12} {'saved':>6}")
+    for name, sizes in report.items():
+        legacy, compact = sizes["legacy"], sizes["compact"]
+        saved = 1 - compact / legacy if legacy else 0
+        print(f"{name:>32} {legacy / 2**20:11.2f} {compact / 2**20:12.2f} {saved:6.0%}")
+    if args.output:
+        args.output.write_text(
+            json.dumps({"samples": args.samples, **report}, indent=2)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Time repeatability_residuals against the old single-pipeline version.
+
+Run with ``python -m benchmarks.residuals TEST_ID [TEST_ID ...]`` against the
+database configured in secrets.toml.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from results_dashboard.data import SensorData
+from results_dashboard.data.cache import sensor_cache
+from results_dashboard.data.mongo import aggregate
+from results_dashboard.data.store import sample_store
+
+
+def legacy_repeatability_residuals(data: SensorData) -> pd.DataFrame:
+    """repeatability_residuals as it was before the two-pass rewrite."""
+    aggregate_query = [
+        data._match_query,
+        {
+            "$project": {
+                "angle": {"$round": ["$stage_data.set_angle", 6]},
+                "degrees": "$sensor_data.degrees",
+                "sensor_name": 1,
+                "sample_time": 1,
+            }
+        },
+        {
+            "$group": {
+                "_id": {
+                    "angle": "$angle",
+                    "sensor_name": "$sensor_name",
+                },
+                "avg_degrees": {"$avg": "$degrees"},
+                "samples": {"$push": "$$ROOT"},
+            }
+        },
+        {"$unwind": "$samples"},
+        {
+            "$project": {
+                "sample_time": "$samples.sample_time",
+                "sensor_name": "$samples.sensor_name",
+                "set_angle": "$samples.angle",
+                "sensor_degrees": "$samples.degrees",
+                "residual": {"$subtract": ["$samples.degrees", "$avg_degrees"]},
+            }
+        },
+    ]
+    return pd.DataFrame(list(aggregate("sample", aggregate_query, allowDiskUse=True)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("test_ids", nargs="+")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # time both versions against Mongo, whatever secrets.toml says
+    sample_store.enabled = False
+    data = SensorData(args.test_ids)
+    timings = {"legacy": [], "two-pass": []}
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        legacy = legacy_repeatability_residuals(data)
+        timings["legacy"].append(time.perf_counter() - start)
+
+        sensor_cache.clear()
+        start = time.perf_counter()
+        current = data.repeatability_residuals()
+        timings["two-pass"].append(time.perf_counter() - start)
+
+    key = ["sensor_name", "sample_time"]
+    merged = legacy.merge(current, on=key, suffixes=("_legacy", ""))
+    max_diff = np.abs(merged["residual_legacy"] - merged["residual"]).max()
+
+    print(f"rows: {len(current):,}")
+    for name, times in timings.items():
+        print(f"{name:>9}: best {min(times):.3f} s, mean {np.mean(times):.3f} s")
+    print(f"max residual difference: {max_diff:.3g}")
+
+
+if __name__ == "__main__":
+    main()
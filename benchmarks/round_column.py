@@ -0,0 +1,88 @@
+"""Compare round_column's vectorized snapping with the old per-row lambda.
+
+Run with ``python -m benchmarks.round_column``. The old implementation is
+timed on a subsample and extrapolated, since a full run takes hours.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from results_dashboard.data import round_column
+
+
+def legacy_round_column(df: pd.DataFrame, column: str, round_to: list[float]):
+    """round_column as it was before snap_to_grid."""
+
+    def round_to_nearest(value: float, values: list) -> float:
+        series = pd.Series(values, dtype=float)
+        exact = series.loc[series == value]
+        if not exact.empty:
+            return value
+        rvalue = round(float(value), 6)
+        lo = float(series.loc[series < value].max())
+        hi = float(series.loc[series > value].min())
+        lodiff = round(rvalue - lo, 6)
+        hidiff = round(hi - rvalue, 6)
+
+        if hidiff <= lodiff:
+            return hi
+        return lo
+
+    round_to_lo = [x + (min(round_to) * 2) for x in round_to]
+    round_to_hi = [x + (max(round_to) * 2) for x in round_to]
+    round_to = round_to_lo[:-1] + round_to + round_to_hi[1:]
+
+    df[column] = df[column].map(lambda x: round_to_nearest(x, round_to))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--grid", type=int, default=2_000)
+    parser.add_argument("--legacy-rows", type=int, default=2_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    grid = list(np.round(np.linspace(-60, 60, args.grid), 6))
+    # zeroed angles: grid points shifted by a small per-sensor offset
+    values = rng.choice(grid, args.rows) + rng.normal(0, 0.01, args.rows)
+    # include exact hits and midpoints to exercise the tie-breaking rule
+    values[: args.rows // 10] = rng.choice(grid, args.rows // 10)
+    step = grid[1] - grid[0]
+    values[args.rows // 10 : args.rows // 5] = (
+        rng.choice(grid[:-1], args.rows // 10) + step / 2
+    )
+    rng.shuffle(values)
+
+    df = pd.DataFrame({"angle": values})
+    start = time.perf_counter()
+    round_column(df, "angle", grid)
+    vectorized = time.perf_counter() - start
+
+    sample = pd.DataFrame({"angle": values[: args.legacy_rows]})
+    start = time.perf_counter()
+    legacy_round_column(sample, "angle", grid)
+    legacy = time.perf_counter() - start
+
+    matches = np.array_equal(
+        sample["angle"].to_numpy(),
+        df["angle"].to_numpy()[: args.legacy_rows],
+        equal_nan=True,
+    )
+    extrapolated = legacy / args.legacy_rows * args.rows
+
+    print(f"rows: {args.rows:,}, grid points: {args.grid:,}")
+    print(f"snap_to_grid:   {vectorized:10.3f} s")
+    print(
+        f"legacy lambda:  {extrapolated:10.3f} s "
+        f"(extrapolated from {args.legacy_rows:,} rows in {legacy:.3f} s)"
+    )
+    print(f"speedup:        {extrapolated / vectorized:10.0f}x")
+    print(f"results match:  {matches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""Time every SensorData method on synthetic datasets of increasing size.
+
+Run with ``python -m benchmarks.sensor_data`` against a local MongoDB
+(``--uri``, default ``mongodb://localhost:27017``), or with ``--mock`` to use
+mongomock when it is installed. mongomock lacks some of the aggregation
+operators the queries use, so with ``--mock`` only the ``store`` source gives
+complete results; methods that fail are recorded with their error.
+
+Each size is loaded, every method is timed from an empty result cache, and
+the dataset is deleted again. ``--source mongo`` runs the aggregations on the
+server and ``--source store`` serves them from a temporary local sample
+store. Results are written as JSON; pass an earlier run as ``--baseline`` to
+print how the timings changed.
+"""
+import argparse
+import json
+import platform
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pymongo
+
+from results_dashboard.data import SensorData
+from results_dashboard.data.cache import sensor_cache
+from results_dashboard.data.indexes import INDEXES
+from results_dashboard.data.mongo import mongo_tilt_db, use_client
+from results_dashboard.data.store import sample_store
+
+from .synthetic import DatasetSpec, load, unload
+
+METHODS = {
+    "angle_data": lambda data: data.angle_data,
+    "temperature_data": lambda data: data.temperature_data(),
+    "linearity": lambda data: data.linearity(),
+    "repeatability": lambda data: data.repeatability(),
+    "accuracy": lambda data: data.accuracy,
+    "repeatability_residuals": lambda data: data.repeatability_residuals(),
+}
+
+
+def parse_size(size: str) -> int:
+    """``10k``, ``1M`` or ``10_000`` as a number of samples."""
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(size[-1].lower(), 1)
+    number = size[:-1] if multiplier > 1 else size
+    return int(float(number.replace("_", "")) * multiplier)
+
+
+def time_method(data: SensorData, method, repeat: int) -> dict:
+    seconds = []
+    try:
+        for _ in range(repeat):
+            sensor_cache.clear()
+            start = time.perf_counter()
+            result = method(data)
+            seconds.append(time.perf_counter() - start)
+    except Exception as e:
+        return {"seconds": seconds, "error": f"{type(e).__name__}: {e}"}
+    return {
+        "seconds": seconds,
+        "best": min(seconds),
+        "mean": float(np.mean(seconds)),
+        "rows": len(result),
+    }
+
+
+def run_size(samples: int, args, source: str) -> dict:
+    spec = DatasetSpec(
+        samples=samples,
+        tests=args.tests,
+        sensors=args.sensors,
+        samples_per_step=args.samples_per_step,
+        seed=args.seed,
+    )
+    db = mongo_tilt_db()
+    start = time.perf_counter()
+    test_ids = load(db, spec)
+    load_seconds = time.perf_counter() - start
+    try:
+        data = SensorData(test_ids)
+        results = {"samples": samples, "load_seconds": load_seconds, "methods": {}}
+        if source == "store":
+            start = time.perf_counter()
+            for test_id in test_ids:
+                sample_store.sync(test_id)
+            results["sync_seconds"] = time.perf_counter() - start
+        for name in args.methods:
+            results["methods"][name] = time_method(data, METHODS[name], args.repeat)
+            timing = results["methods"][name]
+            if "error" in timing:
+                print(f"{samples:>12,} {name:>24}: {timing['error']}")
+            else:
+                print(f"{samples:>12,} {name:>24}: best {timing['best']:.3f} s")
+        return results
+    finally:
+        unload(db, test_ids)
+
+
+def compare(results: dict, baseline: dict) -> None:
+    """Print each method's best time against the same method in ``baseline``."""
+    previous = {
+        (size["samples"], name): timing.get("best")
+        for size in baseline["sizes"]
+        for name, timing in size["methods"].items()
+    }
+    print("\nchange against baseline:")
+    for size in results["sizes"]:
+        for name, timing in size["methods"].items():
+            before = previous.get((size["samples"], name))
+            if before and timing.get("best"):
+                print(
+                    f"{size['samples']:>12,} {name:>24}: {before:.3f} s -> "
+                    f"{timing['best']:.3f} s ({timing['best'] / before:.2f}x)"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="10k,1M,10M")
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--mock", action="store_true")
+    parser.add_argument("--source", choices=["mongo", "store"], default="mongo")
+    parser.add_argument("--methods", nargs="+", choices=list(METHODS))
+    parser.add_argument("--tests", type=int, default=1)
+    parser.add_argument("--sensors", type=int, default=24)
+    parser.add_argument("--samples-per-step", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=Path("sensor_data.json"))
+    parser.add_argument("--baseline", type=Path)
+    args = parser.parse_args()
+    args.methods = args.methods or list(METHODS)
+
+    if args.mock:
+        import mongomock
+
+        use_client(mongomock.MongoClient())
+    else:
+        use_client(pymongo.MongoClient(args.uri))
+        db = mongo_tilt_db()
+        for collection, models in INDEXES.items():
+            db[collection].create_indexes(models)
+
+    store_dir = tempfile.TemporaryDirectory()
+    sample_store.enabled = args.source == "store"
+    sample_store.path = Path(store_dir.name)
+
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "source": args.source,
+        "server": "mongomock" if args.mock else args.uri,
+        "parameters": {
+            "tests": args.tests,
+            "sensors": args.sensors,
+            "samples_per_step": args.samples_per_step,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "versions": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "pymongo": pymongo.__version__,
+        },
+        "sizes": [],
+    }
+    try:
+        for size in args.sizes.split(","):
+            results["sizes"].append(run_size(parse_size(size), args, args.source))
+    finally:
+        store_dir.cleanup()
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f"results written to {args.output}")
+
+    if args.baseline:
+        compare(results, json.loads(args.baseline.read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Synthetic ``test`` and ``sample`` documents shaped like a tilt test rig's.
+
+Each test sweeps its sensors up and down an angle grid, holding every step
+for ``samples_per_step`` readings per sensor, until it has written the
+requested number of samples. Sensors have their own gain and zero offset
+around the 16-bit mid-scale, so zeroing, linearity and repeatability all
+have something to find, and the oven temperature drifts over the test.
+
+Run with ``python -m benchmarks.synthetic`` to print a summary of a dataset
+without loading it anywhere.
+"""
+import argparse
+import math
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterator
+
+import numpy as np
+from bson import ObjectId
+
+MID_SCALE = 32768
+
+
+@dataclass
+class DatasetSpec:
+    """What to generate. ``samples`` is the total across every test."""
+
+    samples: int
+    tests: int = 1
+    sensors: int = 24
+    sensors_per_series: int = 8
+    angle_limit: float = 60.0
+    angle_step: float = 5.0
+    samples_per_step: int = 20
+    duration: timedelta = timedelta(hours=12)
+    start: datetime = datetime(2023, 1, 2, 8)
+    seed: int = 0
+
+
+def angle_grid(limit: float, step: float) -> np.ndarray:
+    """One up-and-down sweep from ``-limit`` to ``limit`` and back."""
+    up = np.round(np.arange(-limit, limit + step / 2, step), 6)
+    return np.concatenate([up, up[-2:0:-1]])
+
+
+def sensor_names(sensors: int, per_series: int) -> list[str]:
+    return [f"TS{i // per_series + 1}-{i % per_series + 1}" for i in range(sensors)]
+
+
+def _test_doc(test_id: ObjectId, name: str, start: datetime, rows: int, steps: int):
+    return {
+        "_id": test_id,
+        "name": name,
+        "description": "Synthetic benchmark test",
+        "test_start_time": start,
+        "rows_written": rows,
+        "test_progress": 1.0,
+        "status": {"total_steps": steps, "steps_completed": steps},
+        "test_info": {"hostname": "benchmark", "oven": {}, "stage": {}, "sensors": {}},
+    }
+
+
+def _sample_batch(
+    test_id: ObjectId,
+    names: list[str],
+    times: np.ndarray,
+    set_angles: np.ndarray,
+    gains: np.ndarray,
+    zeros: np.ndarray,
+    oven: np.ndarray,
+    rng: np.random.Generator,
+) -> list[dict]:
+    """Samples for a run of readings, every sensor at each reading."""
+    shape = (len(times), len(names))
+    stage = set_angles + rng.normal(0, 0.002, len(times))
+    degrees = stage[:, None] + zeros + rng.normal(0, 0.01, shape)
+    raw = np.round(MID_SCALE + gains * (degrees - zeros))
+    integrated = oven + rng.normal(0, 0.05, len(times))
+    thermocouple = oven + rng.normal(-0.2, 0.1, len(times))
+    ambient = 22 + rng.normal(0, 0.3, len(times))
+
+    docs = []
+    for i, sample_time in enumerate(times.astype("datetime64[ms]").tolist()):
+        temperature = {
+            "oven_set_temperature": 25.0,
+            "oven_integrated_temperature": float(integrated[i]),
+            "thermocouple_temperature": float(thermocouple[i]),
+            "ambient_temperature": float(ambient[i]),
+        }
+        stage_data = {
+            "set_angle": float(set_angles[i]),
+            "stage_angle": float(stage[i]),
+        }
+        for j, name in enumerate(names):
+            docs.append(
+                {
+                    "test_id": test_id,
+                    "sensor_name": name,
+                    "sample_time": sample_time,
+                    "stage_data": stage_data,
+                    "temperature_data": temperature,
+                    "sensor_data": {
+                        "raw": float(raw[i, j]),
+                        "degrees": float(degrees[i, j]),
+                        "pass_fail": "pass",
+                        "debug_info": "",
+                    },
+                }
+            )
+    return docs
+
+
+def generate(
+    spec: DatasetSpec, batch_size: int = 10_000
+) -> Iterator[tuple[dict, Iterator[list[dict]]]]:
+    """Yield each test document with an iterator over its sample batches.
+
+    Samples are generated lazily, so datasets larger than memory can be
+    streamed straight into a collection.
+    """
+    rng = np.random.default_rng(spec.seed)
+    names = sensor_names(spec.sensors, spec.sensors_per_series)
+    grid = angle_grid(spec.angle_limit, spec.angle_step)
+    readings_per_test = math.ceil(spec.samples / spec.tests / spec.sensors)
+    readings_per_batch = max(batch_size // spec.sensors, 1)
+    interval = spec.duration / readings_per_test
+
+    for t in range(spec.tests):
+        test_id = ObjectId()
+        start = spec.start + t * spec.duration
+        steps = math.ceil(readings_per_test / spec.samples_per_step)
+        doc = _test_doc(
+            test_id,
+            f"Synthetic-{t + 1}",
+            start,
+            readings_per_test * spec.sensors,
+            steps,
+        )
+        gains = rng.normal(400, 10, spec.sensors)
+        zeros = rng.normal(0, 0.5, spec.sensors)
+
+        def batches(test_id=test_id, start=start, gains=gains, zeros=zeros):
+            for first in range(0, readings_per_test, readings_per_batch):
+                reading = np.arange(
+                    first, min(first + readings_per_batch, readings_per_test)
+                )
+                step = reading // spec.samples_per_step
+                progress = reading / readings_per_test
+                times = np.datetime64(start, "ms") + (
+                    reading * (interval / timedelta(milliseconds=1))
+                ).astype("timedelta64[ms]")
+                yield _sample_batch(
+                    test_id,
+                    names,
+                    times,
+                    grid[step % len(grid)],
+                    gains,
+                    zeros,
+                    # the oven settles a couple of degrees over the test
+                    25 + 2 * (1 - np.exp(-5 * progress)),
+                    rng,
+                )
+
+        yield doc, batches()
+
+
+def load(db, spec: DatasetSpec, batch_size: int = 10_000) -> list[str]:
+    """Insert a dataset into ``db``'s test and sample collections."""
+    test_ids = []
+    for doc, batches in generate(spec, batch_size):
+        db["test"].insert_one(doc)
+        for batch in batches:
+            db["sample"].insert_many(batch, ordered=False)
+        test_ids.append(str(doc["_id"]))
+    return test_ids
+
+
+def unload(db, test_ids: list[str]) -> None:
+    ids = [ObjectId(test_id) for test_id in test_ids]
+    db["sample"].delete_many({"test_id": {"$in": ids}})
+    db["test"].delete_many({"_id": {"$in": ids}})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--samples", type=int, default=10_000)
+    parser.add_argument("--tests", type=int, default=1)
+    parser.add_argument("--sensors", type=int, default=24)
+    parser.add_argument("--samples-per-step", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    spec = DatasetSpec(
+        samples=args.samples,
+        tests=args.tests,
+        sensors=args.sensors,
+        samples_per_step=args.samples_per_step,
+        seed=args.seed,
+    )
+    total = 0
+    for doc, batches in generate(spec):
+        count = sum(len(batch) for batch in batches)
+        total += count
+        print(f"{doc['name']}: {count:,} samples from {doc['test_start_time']}")
+    print(f"total: {total:,} samples")
+
+
+if __name__ == "__main__":
+    main()
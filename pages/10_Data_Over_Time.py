@@ -1,9 +1,13 @@
 import altair as alt
 import streamlit as st
 
-from results_dashboard.data import SensorData
+from results_dashboard.data import SensorData, perf
+from results_dashboard.data.downsample import downsample
 from results_dashboard.data.mongo import tests_db
 from results_dashboard.sidebar import show_sidebar
+from results_dashboard.sidebar.live import wait_for_refresh
+from results_dashboard.sidebar.status import show_status
+from results_dashboard.sidebar.time_window import show_time_window
 
 # Sidebar/Multipage
 
@@ -12,7 +16,10 @@ st.set_page_config(
     page_icon="https://frederickscompany.com/wp-content/uploads/2017/08/F_logo_082017-e1502119400827.png",
 )
 
-data = show_sidebar()
+data = show_sidebar("Data Over Time")
+# the page's queries are independent, so run them at once
+data.prefetch("_metadata", "angle_data", "temperature_data")
+perf.checkpoint("Prefetch")
 
 # Main content
 
@@ -23,6 +30,9 @@ st.write(
     " highlight any major performance issues."
 )
 
+if not data.empty:
+    data = show_time_window(data, key="data_over_time_window")
+
 # Angle over Time
 
 st.subheader("Set Angle vs Time")
@@ -31,7 +41,7 @@ if data.empty:
     st.warning("No data to show")
 else:
     # df = data.downsampled[["sample_time", "set_angle", "stage_angle"]]
-    df = data.angle_data
+    df = downsample(data.angle_data, "sample_time", "set_angle")
     chart = (
         alt.Chart(df)
         .mark_line()
@@ -49,6 +59,8 @@ else:
     )
     st.altair_chart(chart, use_container_width=True, theme="streamlit")
 
+perf.checkpoint("Set angle vs time")
+
 # Temperature over Time
 
 st.subheader("Temperature over Time")
@@ -58,10 +70,10 @@ if data.empty:
     st.warning("No data to show")
 
 else:
-    df = data.temperature_data
+    df = downsample(data.temperature_data(), "sample_time", "mean", by="source")
 
     chart = (
-        alt.Chart(data.temperature_data)
+        alt.Chart(df)
         .mark_line()
         .encode(
             x=alt.X("sample_time", title="Time"),
@@ -80,3 +92,7 @@ else:
     chart = chart.properties(title="Temperature over Time").interactive()
 
     st.altair_chart(chart, use_container_width=True, theme="streamlit")
+
+perf.checkpoint("Temperature over time")
+show_status()
+wait_for_refresh()
@@ -4,8 +4,9 @@ from datetime import datetime
 import pandas as pd
 import streamlit as st  # type: ignore
 
-from results_dashboard.data.mongo import tests_db
+from results_dashboard.data.catalog import test_catalog
 from results_dashboard.sidebar import show_sidebar
+from results_dashboard.sidebar.status import show_status
 
 # Sidebar/Multipage
 
@@ -14,7 +15,7 @@ st.set_page_config(
     page_icon="https://frederickscompany.com/wp-content/uploads/2017/08/F_logo_082017-e1502119400827.png",
 )
 
-data = show_sidebar()
+data = show_sidebar("Test Info")
 
 # Main Page
 st.write("# Test Info")
@@ -26,7 +27,7 @@ if data.empty:
 info = data.test_info
 # st.write(info)
 
-tests = tests_db.get_tests(object_ids=data.test_ids)
+tests = test_catalog.tests(data.test_ids)
 selected_test_name = st.selectbox(
     "Select a test",
     options=tests["label"].tolist(),
@@ -144,3 +145,5 @@ with st.form("test_info"):
     submitted = st.form_submit_button("Update")
     if submitted:
         st.write(new_info)
+
+show_status()
@@ -2,9 +2,11 @@ import altair as alt
 import pandas as pd
 import streamlit as st
 
-from results_dashboard.data import SensorData
+from results_dashboard.data import SensorData, perf
 from results_dashboard.data.mongo import tests_db
 from results_dashboard.sidebar import show_sidebar
+from results_dashboard.sidebar.live import wait_for_refresh
+from results_dashboard.sidebar.status import show_status
 
 # Sidebar/Multipage
 
@@ -13,7 +15,10 @@ st.set_page_config(
     page_icon="https://frederickscompany.com/wp-content/uploads/2017/08/F_logo_082017-e1502119400827.png",
 )
 
-data = show_sidebar()
+data = show_sidebar("Accuracy")
+# the page's queries are independent, so run them at once
+data.prefetch("_metadata", "_angle_stats")
+perf.checkpoint("Prefetch")
 
 st.sidebar.write("### Accuracy Options")
 expected_accuracy = st.sidebar.number_input("Expected Accuracy")
@@ -96,3 +101,7 @@ else:
         chart += spec_chart
 
     st.altair_chart(chart.interactive(), use_container_width=True, theme="streamlit")
+
+perf.checkpoint("Accuracy by sensor")
+show_status()
+wait_for_refresh()
@@ -2,7 +2,12 @@ import altair as alt
 import pandas as pd
 import streamlit as st
 
+from results_dashboard.data import perf
+from results_dashboard.data.downsample import downsample
 from results_dashboard.sidebar import show_sidebar
+from results_dashboard.sidebar.live import wait_for_refresh
+from results_dashboard.sidebar.status import show_status
+from results_dashboard.sidebar.time_window import show_time_window
 
 # st.write("Work in progress")
 
@@ -11,7 +16,10 @@ st.set_page_config(
     page_icon="https://frederickscompany.com/wp-content/uploads/2017/08/F_logo_082017-e1502119400827.png",
 )
 
-data = show_sidebar()
+data = show_sidebar("Repeatability")
+# the page's queries are independent, so run them at once
+data.prefetch("_metadata", "_angle_stats")
+perf.checkpoint("Prefetch")
 
 st.sidebar.write("### Repeatability Options")
 zeroed = st.sidebar.checkbox("Use zeroed values", value=True, key="zeroed")
@@ -125,6 +133,7 @@ else:
 
     st.altair_chart(chart, use_container_width=True, theme="streamlit")
 
+perf.checkpoint("Repeatability by sensor")
 
 # By Sensor Group
 
@@ -215,6 +224,8 @@ else:
 
     st.altair_chart(chart.interactive(), use_container_width=True, theme="streamlit")
 
+perf.checkpoint("Repeatability by sensor group")
+
 st.write("### Repeatability Characteristics")
 
 st.write(
@@ -232,7 +243,8 @@ st.write(
 if data.empty:
     st.warning("No data to display")
 else:
-    df = data.repeatability_residuals()
+    window_data = show_time_window(data, key="repeatability_residual_window")
+    df = window_data.repeatability_residuals()
 
     sensors = st.selectbox(
         "Select a sensor",
@@ -253,6 +265,7 @@ else:
         df = df[df["sensor_name"] == sensors]
 
     df = df[(df["set_angle"] >= angle_range[0]) & (df["set_angle"] <= angle_range[1])]
+    df = downsample(df, "sample_time", "residual", by="sensor_name")
 
     chart = (
         alt.Chart(df)
@@ -284,3 +297,7 @@ else:
     chart = chart.properties(title=title)
 
     st.altair_chart(chart.interactive(), use_container_width=True, theme="streamlit")
+
+perf.checkpoint("Repeatability characteristics")
+show_status()
+wait_for_refresh()
@@ -1,9 +1,14 @@
-import numpy as np  # type: ignore
-import pandas as pd  # type: ignore
+import tempfile
+from pathlib import Path
+
 import streamlit as st  # type: ignore
 
-from results_dashboard.data.mongo import mongo_tilt_db
+from results_dashboard.data import perf
+from results_dashboard.data.export import export_samples, read_preview
 from results_dashboard.sidebar import show_sidebar
+from results_dashboard.sidebar.status import show_status
+
+EXPORT_MAX_MB = int(st.secrets.get("export_max_mb", 200))
 
 # Sidebar/Multipage
 
@@ -12,72 +17,12 @@ st.set_page_config(
     page_icon="https://frederickscompany.com/wp-content/uploads/2017/08/F_logo_082017-e1502119400827.png",
 )
 
-data = show_sidebar()
+data = show_sidebar("Raw Data")
 
 # Main Page
 st.write("# Raw Data")
 
 
-@st.cache(show_spinner=False, max_entries=1)
-def load_raw_data(data: pd.DataFrame) -> pd.DataFrame:
-    """Get raw data from the database"""
-    db = mongo_tilt_db()
-    df = pd.DataFrame(
-        list(
-            db["sample"].aggregate(
-                [
-                    data._match_query,
-                    {
-                        "$project": {
-                            "_id": 0,
-                            "sensor_name": 1,
-                            "sample_time": 1,
-                            "set_angle": "$stage_data.set_angle",
-                            "stage_angle": "$stage_data.stage_angle",
-                            "oven_set_temperature": "$temperature_data.oven_set_temperature",
-                            "oven_integrated_temperature": "$temperature_data.oven_integrated_temperature",
-                            "thermocouple_temperature": "$temperature_data.thermocouple_temperature",
-                            "ambient_temperature": "$temperature_data.ambient_temperature",
-                            "raw": "$sensor_data.raw",
-                            "degrees": "$sensor_data.degrees",
-                            "pass_fail": "$sensor_data.pass_fail",
-                            "debug_info": "$sensor_data.debug_info",
-                        }
-                    },
-                ]
-            )
-        )
-    )
-
-    df.set_index(["sample_time", "sensor_name"], inplace=True)
-    df.index.names = ["sample_time", "sensor_name"]
-
-    info_columns = [
-        "set_angle",
-        "stage_angle",
-        "oven_set_temperature",
-        "oven_integrated_temperature",
-        "thermocouple_temperature",
-        "ambient_temperature",
-    ]
-    info_df = df[df.index.get_level_values("sensor_name") == df.index[0][1]][
-        info_columns
-    ]
-    info_df.index = info_df.index.droplevel("sensor_name")
-    data_df = df.loc[:, np.invert(np.array(df.columns.isin(info_columns)))].unstack(
-        "sensor_name"
-    )
-    data_df.columns = [f"{mtype}-{sensor}" for mtype, sensor in data_df.columns]
-
-    df = pd.concat([info_df, data_df], axis=1)
-    return df
-
-
-@st.cache(show_spinner=False, max_entries=1)
-def convert_sample_df(df):
-    return df.to_csv().encode("utf-8")
-
-
 @st.cache(show_spinner=False, max_entries=1)
 def convert_rep_df(df):
     return df.to_csv().encode("utf-8")
@@ -87,18 +32,34 @@ st.write("## Samples")
 if data.empty:
     st.warning("No data available for selected tests")
 else:
+    export_format = st.radio("Format", ["CSV", "Parquet"], horizontal=True)
+    fmt = export_format.lower()
     if st.button("Get Raw Sample Data"):
-        with st.spinner("Loading data..."):
-            df = load_raw_data(data)
-
-        st.write(df)
-
-        st.download_button(
-            label="Download as CSV",
-            data=convert_sample_df(df),
-            file_name="samples.csv",
-            mime="text/csv",
-        )
+        # removed with everything in it once the download button is set up
+        with tempfile.TemporaryDirectory() as export_dir:
+            export_path = Path(export_dir) / f"samples.{fmt}"
+            with st.spinner("Loading data..."):
+                rows = export_samples(data, export_path, fmt=fmt)
+
+            st.write(f"Showing the first 1,000 of {rows:,} rows")
+            st.write(read_preview(export_path, fmt=fmt))
+
+            # Streamlit keeps a download's bytes in memory for the session
+            size_mb = export_path.stat().st_size / 2**20
+            if size_mb > EXPORT_MAX_MB:
+                st.warning(
+                    f"The export is {size_mb:,.0f} MB, more than the "
+                    f"{EXPORT_MAX_MB} MB that can be downloaded. Select fewer "
+                    "tests or sensors, or export as Parquet."
+                )
+            else:
+                st.download_button(
+                    label=f"Download as {export_format}",
+                    data=export_path.read_bytes(),
+                    file_name=f"samples.{fmt}",
+                    mime="text/csv" if fmt == "csv" else "application/octet-stream",
+                )
+perf.checkpoint("Samples")
 #
 st.write("## Repeatability")
 if data.empty:
@@ -120,3 +81,6 @@ else:
             file_name="repeatability.csv",
             mime="text/csv",
         )
+
+perf.checkpoint("Repeatability")
+show_status()
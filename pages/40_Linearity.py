@@ -1,19 +1,23 @@
 import traceback
 
 import altair as alt
-import numpy as np
 import pandas as pd
 import streamlit as st
-from sklearn.linear_model import LinearRegression
 
+from results_dashboard.data import perf
 from results_dashboard.sidebar import show_sidebar
+from results_dashboard.sidebar.live import wait_for_refresh
+from results_dashboard.sidebar.status import show_status
 
 st.set_page_config(
     page_title="Linearity",
     page_icon="https://frederickscompany.com/wp-content/uploads/2017/08/F_logo_082017-e1502119400827.png",
 )
 
-data = show_sidebar()
+data = show_sidebar("Linearity")
+# the page's queries are independent, so run them at once
+data.prefetch("_metadata", "_angle_stats")
+perf.checkpoint("Prefetch")
 st.sidebar.write("### Linearity Options")
 zeroed = st.sidebar.checkbox("Use zeroed values", value=True, key="zeroed")
 linear_range = st.sidebar.number_input(
@@ -52,6 +56,7 @@ try:
 except KeyError:
     traceback.print_exc()
     st.warning("Zeroing error. Showing unzeroed values")
+    zeroed = False
     df = data.linearity(False)
 
 if linear_range > 0:
@@ -60,26 +65,10 @@ if linear_range > 0:
         & (df.index.get_level_values("angle") >= -linear_range)
     ]
 
-# create lindf now so we have all sensor data in it
+# fit every sensor now so we have all sensor data in lindf
 # this way it will be available for the sensor group
 # section even if the sensor itself has a filter
-lindf = pd.DataFrame(index=df.index)
-for sensor in df.index.get_level_values("sensor_name").unique():
-    mask = df.index.get_level_values("sensor_name") == sensor
-    x = df.loc[mask, "mean_raw"].to_frame()
-    y = df.loc[mask].index.to_frame()["angle"]
-    reg = LinearRegression().fit(x, y)
-    lindf.loc[mask, "mean_residual"] = (
-        reg.predict(df.loc[mask, ["mean_raw"]]) - df.loc[mask].index.to_frame()["angle"]
-    )
-    lindf.loc[mask, "max_residual"] = (
-        reg.predict(df.loc[mask, ["max_raw"]].rename(columns={"max_raw": "mean_raw"}))
-        - df.loc[mask].index.to_frame()["angle"]
-    )
-    lindf.loc[mask, "min_residual"] = (
-        reg.predict(df.loc[mask, ["min_raw"]].rename(columns={"min_raw": "mean_raw"}))
-        - df.loc[mask].index.to_frame()["angle"]
-    )
+lindf = data.linearity_fit(zeroed, linear_range=linear_range)
 
 sensors = st.selectbox(
     "Select a sensor", ["All"] + data.sensor_names, key="linearity_sensor"
@@ -123,20 +112,16 @@ if linear_range > 0:
 
 
 if sensors != "All":
-    x = df.index.to_frame()[["angle"]]
-    y = np.array(df["mean_raw"]).reshape(-1, 1)
-    reg = LinearRegression().fit(x, y)
-    r2 = reg.score(x, y)
-
-    linregr_df = pd.DataFrame(
-        {
-            "angle": [
-                df.index.get_level_values("angle").min(),
-                df.index.get_level_values("angle").max(),
-            ]
-        }
+    angles = df.index.get_level_values("angle")
+    slope, intercept, r2 = (
+        lindf.xs(sensors, level="sensor_name")[["slope", "intercept", "r2"]]
+        .iloc[0]
+        .to_numpy()
     )
-    linregr_df["mean_raw"] = reg.predict(linregr_df[["angle"]])
+
+    # the fit predicts angle from raw output, so invert it to plot raw output
+    linregr_df = pd.DataFrame({"angle": [angles.min(), angles.max()]})
+    linregr_df["mean_raw"] = (linregr_df["angle"] - intercept) / slope
 
     # calculate linear line of best fit
     avg_chart += (
@@ -204,6 +189,7 @@ chart = (zero_line + area_chart + avg_chart).properties(title="Residual Values")
 
 st.altair_chart(chart.interactive(), use_container_width=True, theme="streamlit")
 
+perf.checkpoint("Linearity by sensor")
 
 ############### By Group ###############
 st.write("### By Group")
@@ -226,12 +212,7 @@ groups = st.selectbox(
     "Select a group", ["All"] + data.sensor_groups, key="linearity_group"
 )
 
-try:
-    df = data.linearity(zeroed, series=True)
-except KeyError:
-    traceback.print_exc()
-    st.warning("Zeroing error. Showing unzeroed values")
-    df = data.linearity(False, series=True)
+df = data.linearity(zeroed, series=True)
 
 if linear_range > 0:
     df = df[
@@ -256,11 +237,10 @@ title = "Linearity"
 if linear_range > 0:
     title += f" (+/-{linear_range} deg)"
 
+group_lindf = data.linearity_fit(zeroed, series=True, linear_range=linear_range)
+
 if groups != "All":
-    x = np.array(df.index.to_frame()["angle"]).reshape(-1, 1)
-    y = np.array(df["mean_raw"]).reshape(-1, 1)
-    reg = LinearRegression().fit(x, y)
-    r2 = reg.score(x, y)
+    r2 = group_lindf.xs(groups, level="series")["r2"].iloc[0]
 
     # calculate linear line of best fit
     chart += (
@@ -301,16 +281,10 @@ st.write(
 """
 )
 
-lindf["series"] = lindf.index.get_level_values("sensor_name").map(data.series_mapping)
-group_by = lindf.reset_index().groupby(["angle", "series"])
-lindf = group_by["mean_residual"].mean().to_frame()
-lindf["max_residual"] = group_by["max_residual"].max()
-lindf["min_residual"] = group_by["min_residual"].min()
-
 if groups != "All":
-    gplindf = lindf.xs(groups, level="series", drop_level=False)
+    gplindf = group_lindf.xs(groups, level="series", drop_level=False)
 else:
-    gplindf = lindf
+    gplindf = group_lindf
 
 avg_chart = (
     alt.Chart(gplindf.reset_index())
@@ -346,3 +320,7 @@ zero_line = alt.Chart(pd.DataFrame({"Spec": [0]})).mark_rule().encode(y="Spec")
 chart = (zero_line + area_chart + avg_chart).properties(title="Residual Values")
 
 st.altair_chart(chart.interactive(), use_container_width=True, theme="streamlit")
+
+perf.checkpoint("Linearity by group")
+show_status()
+wait_for_refresh()
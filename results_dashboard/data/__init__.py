@@ -1,52 +1,170 @@
+import logging
+import os
+from datetime import datetime, timedelta
 from typing import List
 
 import numpy as np
 import pandas as pd
-import streamlit as st
+import pyarrow as pa
 from bson import ObjectId
 
-from .mongo import mongo_tilt_db
+from . import local, metadata
+from .cache import cached, prefetching, wait_for
+from .catalog import test_catalog
+from .decode import CATEGORY, DATETIME, FLOAT, aggregate_frame
+from .live import LiveTail, live_tail
+from .metadata import SelectionMetadata
+from .mongo import aggregate
 from .mongo.tests_db import get_test_info
+from .rollup import summary_angle_stats
+from .schema import compacted
+from .store import sample_store
 
+logger = logging.getLogger(__name__)
 
-def round_column(df: pd.DataFrame, column: str, round_to: List[float]) -> pd.Series:
-    """Round a column of a datafram to the nearest value in a series."""
 
-    def round_to_nearest(value: float, values: list) -> float:
-        series = pd.Series(values, dtype=float)
-        exact = series.loc[series == value]
-        if not exact.empty:
-            return value
-        rvalue = round(float(value), 6)
-        lo = float(series.loc[series < value].max())
-        hi = float(series.loc[series > value].min())
-        lodiff = round(rvalue - lo, 6)
-        hidiff = round(hi - rvalue, 6)
-
-        if hidiff <= lodiff:
-            ret = hi
-        else:
-            ret = lo
+def snap_to_grid(values: np.ndarray, grid: List[float]) -> np.ndarray:
+    """Snap values to the nearest point of a grid.
 
-        if pd.isna(ret):
-            print(
-                f"Error: value {value} resulted in NaN - lo: {lo} [{lodiff}], hi: {hi} [{hidiff}]"
-            )
+    Values on the grid are kept as-is. Otherwise the distances to the grid
+    points on either side are compared after rounding to 6 places and ties go
+    to the higher point. Values above the grid snap to its maximum, values
+    below it (and NaN values) become NaN.
+    """
+    values = np.asarray(values, dtype=float)
+    grid = np.unique(np.asarray(grid, dtype=float))
+    grid = grid[~np.isnan(grid)]
+    if grid.size == 0:
+        return np.full(values.shape, np.nan)
+
+    # grid[idx - 1] < value <= grid[idx]
+    idx = np.searchsorted(grid, values, side="left")
+    padded = np.concatenate(([np.nan], grid, [np.nan]))
+    lo = padded[idx]
+    hi = padded[idx + 1]
 
-        return ret
+    rvalues = np.round(values, 6)
+    lodiff = np.round(rvalues - lo, 6)
+    hidiff = np.round(hi - rvalues, 6)
 
+    # comparisons with NaN are False, so a missing hi falls back to lo
+    snapped = np.where(hidiff <= lodiff, hi, lo)
+    snapped = np.where(hi == values, values, snapped)
+    snapped[np.isnan(values)] = np.nan
+    return snapped
+
+
+def round_column(df: pd.DataFrame, column: str, round_to: List[float]) -> pd.Series:
+    """Round a column of a datafram to the nearest value in a series."""
     # extend list to prevent nan's when out of range
     round_to_lo = [x + (min(round_to) * 2) for x in round_to]
     round_to_hi = [x + (max(round_to) * 2) for x in round_to]
     round_to = round_to_lo[:-1] + round_to + round_to_hi[1:]
 
-    df[column] = df[column].map(lambda x: round_to_nearest(x, round_to))
+    snapped = snap_to_grid(df[column].to_numpy(), round_to)
+    missing = np.isnan(snapped).sum()
+    if missing:
+        print(f"Error: {missing} values in {column} resulted in NaN")
+
+    df[column] = snapped
+
+
+def linear_fit(x: np.ndarray, y: np.ndarray, groups: pd.Series) -> pd.DataFrame:
+    """Least-squares fit of ``y = slope * x + intercept`` for every group at once.
+
+    Returns a frame indexed by group with ``slope``, ``intercept`` and ``r2``.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    codes, uniques = pd.factorize(groups)
+    valid = (codes >= 0) & np.isfinite(x) & np.isfinite(y)
+    x, y, codes = x[valid], y[valid], codes[valid]
+    size = len(uniques)
+
+    n = np.bincount(codes, minlength=size).astype(float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_mean = np.bincount(codes, x, size) / n
+        y_mean = np.bincount(codes, y, size) / n
+        # centre before summing products to avoid cancellation on raw counts
+        dx = x - x_mean[codes]
+        dy = y - y_mean[codes]
+        sxx = np.bincount(codes, dx * dx, size)
+        sxy = np.bincount(codes, dx * dy, size)
+        syy = np.bincount(codes, dy * dy, size)
+
+        slope = sxy / sxx
+        intercept = y_mean - slope * x_mean
+        r2 = sxy**2 / (sxx * syy)
+
+    return pd.DataFrame(
+        {"slope": slope, "intercept": intercept, "r2": r2},
+        index=pd.Index(uniques, name=getattr(groups, "name", None)),
+    )
+
+
+# widths temperature buckets are picked from; each divides a day, so buckets
+# line up whether they are cut by $dateTrunc or pandas
+BUCKET_WIDTHS = [
+    timedelta(seconds=seconds)
+    for seconds in (1, 2, 5, 10, 15, 30)
+    + tuple(60 * minutes for minutes in (1, 2, 5, 10, 15, 30))
+    + tuple(3600 * hours for hours in (1, 2, 3, 6, 12, 24))
+]
+TEMPERATURE_BUCKETS = 500
+
+# lift a $group's compound _id into top-level fields, so results decode
+# straight into columns
+FLATTEN_ID = [
+    {"$replaceRoot": {"newRoot": {"$mergeObjects": ["$$ROOT", "$_id"]}}},
+    {"$unset": "_id"},
+]
+ANGLE_STATS_FIELDS = {
+    "count": FLOAT,
+    **{
+        f"{stat}_{name}": FLOAT
+        for name, stats in (
+            ("raw", ("max", "min", "mean", "dev")),
+            ("degrees", ("max", "min", "mean")),
+            ("error", ("max", "min", "mean", "dev")),
+        )
+        for stat in stats
+    },
+    "angle": FLOAT,
+    "sensor_name": CATEGORY,
+}
+REPEATABILITY_FIELDS = {
+    "max_degrees": FLOAT,
+    "min_degrees": FLOAT,
+    "range": FLOAT,
+    "repeatability": FLOAT,
+    "angle": FLOAT,
+    "sensor_name": CATEGORY,
+}
+
+
+def bucket_width(duration: timedelta, buckets: int) -> timedelta:
+    """Narrowest of BUCKET_WIDTHS splitting ``duration`` into at most ``buckets``."""
+    for width in BUCKET_WIDTHS:
+        if duration / width <= buckets:
+            return width
+    return BUCKET_WIDTHS[-1]
+
+
+def _date_trunc_unit(width: timedelta) -> tuple[str, int]:
+    """``$dateTrunc`` unit and binSize for a bucket width."""
+    seconds = int(width.total_seconds())
+    for unit, size in (("day", 86400), ("hour", 3600), ("minute", 60)):
+        if seconds % size == 0:
+            return unit, seconds // size
+    return "second", seconds
 
 
 class SensorData:
     def __init__(self, test_ids: str | list[str]) -> None:
         self._test_ids = test_ids if isinstance(test_ids, list) else [test_ids]
         self._sensor_mask: list[str] | None = None
+        self._time_window: tuple[datetime, datetime] | None = None
+        self._live_tail: LiveTail | None = None
 
     @property
     def test_ids(self) -> list[str]:
@@ -66,6 +184,86 @@ class SensorData:
     def sensor_mask(self, sensor_mask: list[str] | None) -> None:
         self._sensor_mask = sensor_mask
 
+    @property
+    def time_window(self) -> tuple[datetime, datetime] | None:
+        """Inclusive sample_time range to limit queries to, or None for all."""
+        return self._time_window
+
+    @time_window.setter
+    def time_window(self, time_window: tuple[datetime, datetime] | None) -> None:
+        self._time_window = tuple(time_window) if time_window else None
+
+    @property
+    def cache_key(self) -> tuple:
+        """Normalized selection used to key cached results."""
+        test_ids = tuple(sorted({str(test_id) for test_id in self.test_ids}))
+        sensor_mask = tuple(sorted(set(self.sensor_mask))) if self.sensor_mask else None
+        # tails are per process, so a version only means something in this one
+        live_version = (
+            (os.getpid(), self._live_tail.version) if self._live_tail else None
+        )
+        # results of finished tests never change, so they key apart from the
+        # results computed while the tests were running
+        return test_ids, sensor_mask, self.time_window, live_version, self.complete
+
+    def cache_ttl(self, ttl: float | None) -> float | None:
+        """Seconds a cached result stays fresh, forever once the tests finished."""
+        return None if self.complete else ttl
+
+    @property
+    def live(self) -> bool:
+        return self._live_tail is not None
+
+    @property
+    def complete(self) -> bool:
+        """Whether every selected test has finished."""
+        return self._live_tail is None and test_catalog.complete(self.test_ids)
+
+    def refresh_live(self) -> int:
+        """Serve this selection from its live tail and fold in new samples.
+
+        _angle_stats, angle_data and temperature_data then come from running
+        aggregates, and cached results are keyed on the tail's version, so
+        everything else is recomputed only when new samples arrived. Returns
+        the number of new samples.
+        """
+        if self.time_window is not None:
+            return 0
+        if self._live_tail is None:
+            self._live_tail = live_tail(
+                self.test_ids, self.sensor_mask, self._live_bucket
+            )
+        count = self._live_tail.refresh()
+        # widen the buckets as the test grows; sums only merge into multiples
+        # of the width they were kept at, and the widest is one of all of them
+        bucket = self._live_tail.bucket
+        wanted = self._live_bucket()
+        if wanted > bucket:
+            self._live_tail.rebucket(
+                next(w for w in BUCKET_WIDTHS if w >= wanted and not w % bucket)
+            )
+        return count
+
+    def windowed(self, start: datetime, end: datetime) -> "SensorData":
+        """The same selection limited to samples between ``start`` and ``end``."""
+        data = SensorData(self.test_ids)
+        data.sensor_mask = self.sensor_mask
+        data.time_window = (start, end)
+        return data
+
+    def prefetch(self, *names: str) -> None:
+        """Load cached properties or no-argument methods concurrently.
+
+        The page waits for them as for its own queries, so a rerun can stop
+        the wait. Errors are left for the page's own call to raise.
+        """
+        with prefetching() as pending:
+            for name in names:
+                value = getattr(self, name)
+                if callable(value):
+                    value()
+        wait_for(pending)
+
     @property
     def _match_query(self) -> dict:
         query_ids = [ObjectId(test_id) for test_id in self.test_ids]
@@ -74,176 +272,123 @@ class SensorData:
         if self.sensor_mask:
             query["$match"]["sensor_name"] = {"$in": self.sensor_mask}
 
+        if self.time_window:
+            start, end = self.time_window
+            query["$match"]["sample_time"] = {"$gte": start, "$lte": end}
+
         return query
 
+    def _local_frames(self, columns: list[str]) -> dict[str, pd.DataFrame] | None:
+        """Each test's samples from the local store, or None if it can't serve
+        this selection."""
+        if not sample_store.enabled:
+            return None
+        behind = [t for t in self.test_ids if not sample_store.current(t)]
+        if behind:
+            # query Mongo this time rather than make the page wait for a copy
+            for test_id in behind:
+                sample_store.sync_later(test_id)
+            return None
+
+        try:
+            return {
+                test_id: sample_store.load(
+                    test_id, columns, self.sensor_mask, self.time_window
+                )
+                for test_id in self.test_ids
+            }
+        except OSError:
+            # evicted while being read
+            return None
+        except pa.ArrowException:
+            logger.exception("Reading %s from the sample store failed", self.test_ids)
+            return None
+
+    def _local_samples(self, columns: list[str]) -> pd.DataFrame | None:
+        """Samples from the local store, or None if it can't serve this selection."""
+        frames = self._local_frames(columns)
+        if frames is None:
+            return None
+        return pd.concat(frames.values(), ignore_index=True)
+
     @property
-    @st.cache_data(ttl=60)
-    def angle_data(_self) -> pd.DataFrame:
-        db = mongo_tilt_db()
-        aggregate_query = [
-            _self._match_query,
-            {
-                "$group": {
-                    "_id": "$sample_time",
-                    "stage_data": {"$first": "$stage_data"},
-                }
-            },
+    def _angle_data_query(self) -> list[dict]:
+        return [
+            self._match_query,
+            {"$project": {"_id": 0, "sample_time": 1, "stage_data": 1}},
             {"$replaceRoot": {"newRoot": {"$mergeObjects": ["$$ROOT", "$stage_data"]}}},
             {"$project": {"stage_data": 0}},
-            {"$sort": {"_id": 1}},
-            {"$group": {"_id": 0, "document": {"$push": "$$ROOT"}}},
+            # every sensor at a sample_time shares the same stage data, so
+            # comparing against the previous row in time only keeps the first
+            # row of each angle step
             {
-                "$project": {
-                    "documentAndPrevAngle": {
-                        "$zip": {
-                            "inputs": [
-                                "$document",
-                                {"$concatArrays": [[None], "$document.set_angle"]},
-                            ]
-                        }
-                    }
-                }
-            },
-            {"$unwind": {"path": "$documentAndPrevAngle"}},
-            {
-                "$replaceWith": {
-                    "$mergeObjects": [
-                        {"$arrayElemAt": ["$documentAndPrevAngle", 0]},
-                        {"prev_angle": {"$arrayElemAt": ["$documentAndPrevAngle", 1]}},
-                    ]
-                }
-            },
-            {
-                "$set": {
-                    "angle_difference": {"$subtract": ["$set_angle", "$prev_angle"]}
+                "$setWindowFields": {
+                    "sortBy": {"sample_time": 1},
+                    "output": {
+                        "prev_angle": {"$shift": {"output": "$set_angle", "by": -1}}
+                    },
                 }
             },
-            {"$match": {"angle_difference": {"$ne": 0}}},
-            {"$project": {"prev_angle": 0, "angle_difference": 0}},
-            {"$set": {"sample_time": "$_id"}},
+            {"$match": {"$expr": {"$ne": ["$set_angle", "$prev_angle"]}}},
+            {"$project": {"prev_angle": 0}},
+            {"$sort": {"sample_time": 1}},
         ]
 
-        df = pd.DataFrame(list(db["sample"].aggregate(aggregate_query)))
-        df = df.drop("_id", axis=1).join(pd.DataFrame(df["_id"].tolist()))
-
-        return df
-
     @property
-    @st.cache_data(ttl=60)
-    def temperature_data(_self) -> pd.DataFrame:
-        db = mongo_tilt_db()
+    @cached()
+    def angle_data(self) -> pd.DataFrame:
+        """Stage data for every sample where the set angle changes."""
+        if self._live_tail is not None:
+            return self._live_tail.angle_data()
+
+        samples = self._local_samples(["sample_time", "set_angle", "stage_angle"])
+        if samples is not None:
+            return local.angle_data(samples)
+
+        return aggregate_frame(
+            "sample",
+            self._angle_data_query,
+            {"sample_time": DATETIME, "set_angle": FLOAT, "stage_angle": FLOAT},
+            allowDiskUse=True,
+        )
 
-        aggregate_query = [
-            _self._match_query,
+    def _temperature_query(self, bucket: timedelta) -> list[dict]:
+        unit, bin_size = _date_trunc_unit(bucket)
+        accumulators = {}
+        for column in local.TEMPERATURE_SOURCES:
+            field = f"$temperature_data.{column}"
+            accumulators[f"{column}_max"] = {"$max": field}
+            accumulators[f"{column}_min"] = {"$min": field}
+            accumulators[f"{column}_mean"] = {"$avg": field}
+            accumulators[f"{column}_dev"] = {"$stdDevSamp": field}
+
+        return [
+            self._match_query,
             {
                 "$group": {
                     "_id": {
-                        "year": {"$year": "$sample_time"},
-                        "month": {"$month": "$sample_time"},
-                        "day": {"$dayOfMonth": "$sample_time"},
-                        "hour": {"$hour": "$sample_time"},
-                        "minute": {"$minute": "$sample_time"},
-                    },
-                    "oven_set_temperature_max": {
-                        "$max": "$temperature_data.oven_set_temperature"
-                    },
-                    "oven_set_temperature_min": {
-                        "$min": "$temperature_data.oven_set_temperature"
-                    },
-                    "oven_set_temperature_mean": {
-                        "$avg": "$temperature_data.oven_set_temperature"
-                    },
-                    "oven_set_temperature_dev": {
-                        "$stdDevSamp": "$temperature_data.oven_set_temperature"
-                    },
-                    "oven_integrated_temperature_max": {
-                        "$max": "$temperature_data.oven_integrated_temperature"
-                    },
-                    "oven_integrated_temperature_min": {
-                        "$min": "$temperature_data.oven_integrated_temperature"
-                    },
-                    "oven_integrated_temperature_mean": {
-                        "$avg": "$temperature_data.oven_integrated_temperature"
-                    },
-                    "oven_integrated_temperature_dev": {
-                        "$stdDevSamp": "$temperature_data.oven_integrated_temperature"
-                    },
-                    "thermocouple_temperature_max": {
-                        "$max": "$temperature_data.thermocouple_temperature"
-                    },
-                    "thermocouple_temperature_min": {
-                        "$min": "$temperature_data.thermocouple_temperature"
-                    },
-                    "thermocouple_temperature_mean": {
-                        "$avg": "$temperature_data.thermocouple_temperature"
-                    },
-                    "thermocouple_temperature_dev": {
-                        "$stdDevSamp": "$temperature_data.thermocouple_temperature"
-                    },
-                    "ambient_temperature_max": {
-                        "$max": "$temperature_data.ambient_temperature"
-                    },
-                    "ambient_temperature_min": {
-                        "$min": "$temperature_data.ambient_temperature"
-                    },
-                    "ambient_temperature_mean": {
-                        "$avg": "$temperature_data.ambient_temperature"
-                    },
-                    "ambient_temperature_dev": {
-                        "$stdDevSamp": "$temperature_data.ambient_temperature"
-                    },
-                }
-            },
-            {
-                "$project": {
-                    "_id": 0,
-                    "sample_time": {
-                        "$dateFromParts": {
-                            "year": "$_id.year",
-                            "month": "$_id.month",
-                            "day": "$_id.day",
-                            "hour": "$_id.hour",
-                            "minute": "$_id.minute",
+                        "$dateTrunc": {
+                            "date": "$sample_time",
+                            "unit": unit,
+                            "binSize": bin_size,
                         }
                     },
-                    "oven_integrated_temperature": {
-                        "source": "integrated",
-                        "mean": "$oven_integrated_temperature_mean",
-                        "max": "$oven_integrated_temperature_max",
-                        "min": "$oven_integrated_temperature_min",
-                        "dev": "$oven_integrated_temperature_dev",
-                    },
-                    "oven_set_temperature": {
-                        "source": "setpoint",
-                        "mean": "$oven_set_temperature_mean",
-                        "max": "$oven_set_temperature_max",
-                        "min": "$oven_set_temperature_min",
-                        "dev": "$oven_set_temperature_dev",
-                    },
-                    "thermocouple_temperature": {
-                        "source": "thermocouple",
-                        "mean": "$thermocouple_temperature_mean",
-                        "max": "$thermocouple_temperature_max",
-                        "min": "$thermocouple_temperature_min",
-                        "dev": "$thermocouple_temperature_dev",
-                    },
-                    "ambient_temperature": {
-                        "source": "ambient",
-                        "mean": "$ambient_temperature_mean",
-                        "max": "$ambient_temperature_max",
-                        "min": "$ambient_temperature_min",
-                        "dev": "$ambient_temperature_dev",
-                    },
+                    **accumulators,
                 }
             },
             {
                 "$project": {
-                    "sample_time": 1,
+                    "_id": 0,
+                    "sample_time": "$_id",
                     "docs": [
-                        "$oven_integrated_temperature",
-                        "$oven_set_temperature",
-                        "$thermocouple_temperature",
-                        "$ambient_temperature",
+                        {
+                            "source": source,
+                            "mean": f"${column}_mean",
+                            "max": f"${column}_max",
+                            "min": f"${column}_min",
+                            "dev": f"${column}_dev",
+                        }
+                        for column, source in local.TEMPERATURE_SOURCES.items()
                     ],
                 }
             },
@@ -258,16 +403,76 @@ class SensorData:
                     "dev": "$docs.dev",
                 }
             },
+            {"$sort": {"sample_time": 1}},
         ]
-        df = pd.DataFrame(list(db["sample"].aggregate(aggregate_query)))
-        # df = df.drop("_id", axis=1).join(pd.DataFrame(df["_id"].tolist()))
-        return df
+
+    def temperature_bucket(self) -> timedelta:
+        """Bucket width giving about TEMPERATURE_BUCKETS buckets over the selection."""
+        time_range = self.time_window or self.time_range
+        if time_range is None:
+            return BUCKET_WIDTHS[0]
+        return bucket_width(time_range[1] - time_range[0], TEMPERATURE_BUCKETS)
+
+    def _live_bucket(self) -> timedelta:
+        """``temperature_bucket`` for tests still running, from the catalog.
+
+        Running tests span from their start until now, so this needs no scan
+        of their samples.
+        """
+        started = test_catalog.tests(self.test_ids)["test_start_time"].min()
+        if pd.isna(started):
+            return BUCKET_WIDTHS[0]
+        # pymongo returns naive UTC datetimes
+        return bucket_width(datetime.utcnow() - started, TEMPERATURE_BUCKETS)
+
+    @cached()
+    def temperature_data(self, bucket: timedelta | None = None) -> pd.DataFrame:
+        """Temperature statistics per source and time bucket.
+
+        The bucket width defaults to one keeping the number of buckets about
+        the same for any test length.
+        """
+        if self._live_tail is not None and bucket in (None, self._live_tail.bucket):
+            return self._live_tail.temperature_data()
+
+        bucket = bucket or self.temperature_bucket()
+        samples = self._local_samples(["sample_time"] + list(local.TEMPERATURE_SOURCES))
+        if samples is not None:
+            return local.temperature_data(samples, bucket)
+
+        return aggregate_frame(
+            "sample",
+            self._temperature_query(bucket),
+            {
+                "sample_time": DATETIME,
+                "source": CATEGORY,
+                "mean": FLOAT,
+                "max": FLOAT,
+                "min": FLOAT,
+                "dev": FLOAT,
+            },
+        )
+
+    @cached()
+    def _metadata(self) -> SelectionMetadata:
+        """Sample count, sensors, set angles, time range and per-test counts.
+
+        One aggregation answers every metadata property, so a page rerun costs
+        a single round trip (none while cached) instead of one per property.
+        """
+        if self._live_tail is not None:
+            return self._live_tail.metadata()
+
+        frames = self._local_frames(["sensor_name", "set_angle", "sample_time"])
+        if frames is not None:
+            return metadata.from_frames(frames)
+
+        result = next(aggregate("sample", metadata.metadata_query(self._match_query)))
+        return metadata.from_facet(result)
 
     @property
-    def empty(_self) -> bool:
-        db = mongo_tilt_db()
-        sample = db["sample"].find_one(_self._match_query["$match"])
-        return sample is None
+    def empty(self) -> bool:
+        return self._metadata().count == 0
 
     # TODO
     @property
@@ -275,12 +480,18 @@ class SensorData:
         return get_test_info(self.test_ids)
 
     @property
-    @st.cache_data(ttl=60)
-    def sensor_names(_self) -> list[str]:
-        if _self.empty:
-            return []
-        db = mongo_tilt_db()
-        return list(db["sample"].distinct("sensor_name", _self._match_query["$match"]))
+    def sensor_names(self) -> list[str]:
+        return list(self._metadata().sensor_names)
+
+    @property
+    def time_range(self) -> tuple[datetime, datetime] | None:
+        """First and last sample_time of the selection."""
+        return self._metadata().time_range
+
+    @property
+    def test_counts(self) -> dict[str, int]:
+        """Number of samples of each selected test."""
+        return dict(self._metadata().test_counts)
 
     @property
     def series_mapping(self) -> dict[str, str]:
@@ -295,23 +506,16 @@ class SensorData:
         return self.series
 
     @property
-    @st.cache_data(ttl=60)
-    def set_angles(_self) -> pd.DataFrame:
-        if _self.empty:
-            return []
-        db = mongo_tilt_db()
-        vals = list(
-            db["sample"].distinct("stage_data.set_angle", _self._match_query["$match"])
-        )
-        return [round(v, 6) for v in vals]
+    def set_angles(self) -> list[float]:
+        return list(self._metadata().set_angles)
 
     @property
-    @st.cache_data(ttl=60)
-    def zeroes(_self) -> pd.Series:
-        df = _self._linearity()
+    @cached()
+    def zeroes(self) -> pd.Series:
+        df = self._linearity()
         df = df.loc[(df["mean_raw"] > 32768 - 6000) & (df["mean_raw"] < 32768 + 6000)]
         ser = (
-            df.groupby("sensor_name")
+            df.groupby("sensor_name", observed=True)
             .mean(numeric_only=True)
             .reset_index()[["angle", "sensor_name"]]
             .set_index("sensor_name")["angle"]
@@ -320,45 +524,92 @@ class SensorData:
 
         return ser
 
-    @st.cache_data(ttl=60)
-    def _linearity(_self) -> pd.DataFrame:
-        db = mongo_tilt_db()
-
-        aggregate_query = [
-            _self._match_query,
+    @property
+    def _angle_stats_query(self) -> list[dict]:
+        error = {
+            "$sum": [
+                "$stage_data.stage_angle",
+                {"$multiply": [-1, "$sensor_data.degrees"]},
+            ]
+        }
+        return [
+            self._match_query,
             {
                 "$group": {
                     "_id": {
-                        "angle": "$stage_data.set_angle",
+                        "angle": {"$round": ["$stage_data.set_angle", 6]},
                         "sensor_name": "$sensor_name",
                     },
+                    "count": {"$sum": 1},
                     "max_raw": {"$max": "$sensor_data.raw"},
                     "min_raw": {"$min": "$sensor_data.raw"},
                     "mean_raw": {"$avg": "$sensor_data.raw"},
                     "dev_raw": {"$stdDevSamp": "$sensor_data.raw"},
+                    "max_degrees": {"$max": "$sensor_data.degrees"},
+                    "min_degrees": {"$min": "$sensor_data.degrees"},
+                    "mean_degrees": {"$avg": "$sensor_data.degrees"},
+                    "max_error": {"$max": error},
+                    "min_error": {"$min": error},
+                    "mean_error": {"$avg": error},
+                    "dev_error": {"$stdDevSamp": error},
                 }
             },
+            *FLATTEN_ID,
         ]
 
-        df = pd.DataFrame(list(db["sample"].aggregate(aggregate_query)))
-        df = df.drop("_id", axis=1).join(pd.DataFrame(df["_id"].tolist()))
-
-        df["angle"].round(6)
+    def _summary_angle_stats(self) -> pd.DataFrame | None:
+        """Angle statistics from rollups even if they lag the samples, used
+        when the full scan runs past its query budget."""
+        if self.time_window is not None or self._live_tail is not None:
+            return None
+        return summary_angle_stats(self.test_ids, self.sensor_mask, partial=True)
+
+    @cached(fallback=_summary_angle_stats)
+    def _angle_stats(self) -> pd.DataFrame:
+        """Raw, degrees and error statistics per angle and sensor.
+
+        One pass over the samples backs _linearity, accuracy, _repeatability
+        and the residual means, so switching between those pages costs a
+        single scan. Up-to-date rollups from the sample_summary collection are
+        used when every selected test has one and no time window is set.
+        """
+        if self._live_tail is not None:
+            return self._live_tail.angle_stats()
+
+        if self.time_window is None:
+            stats = summary_angle_stats(self.test_ids, self.sensor_mask)
+            if stats is not None:
+                return stats
+
+        samples = self._local_samples(
+            ["set_angle", "sensor_name", "raw", "degrees", "stage_angle"]
+        )
+        if samples is not None:
+            return local.angle_stats(samples)
 
+        df = aggregate_frame("sample", self._angle_stats_query, ANGLE_STATS_FIELDS)
+        df["count"] = df["count"].astype(int)
         return df
 
+    def _linearity(self) -> pd.DataFrame:
+        return self._angle_stats()[
+            ["max_raw", "min_raw", "mean_raw", "dev_raw", "angle", "sensor_name"]
+        ]
+
+    @compacted
     def linearity(self, zeroed: bool = False, series: bool = False) -> pd.DataFrame:
         df = self._linearity().copy()
 
         if zeroed:
-            df["zero"] = df["sensor_name"].map(self.zeroes)
+            # mapping a categorical column gives a categorical of zeroes
+            df["zero"] = df["sensor_name"].map(self.zeroes).astype(float)
             df["angle"] = df["angle"] - df["zero"]
             df.drop("zero", axis=1, inplace=True)
             round_column(df, "angle", self.set_angles)
 
         if series:
             df["series"] = df["sensor_name"].map(self.series_mapping)
-            gb = df.groupby(["series", "angle"])
+            gb = df.groupby(["series", "angle"], observed=True)
             df = gb["mean_raw"].mean(numeric_only=True).to_frame()
             df["max_raw"] = gb["max_raw"].max()
             df["min_raw"] = gb["min_raw"].min()
@@ -367,12 +618,51 @@ class SensorData:
 
         return df
 
-    @st.cache_data(ttl=60)
-    def _repeatability(_self, dropped_rows: int) -> pd.DataFrame:
-        db = mongo_tilt_db()
+    @compacted
+    def linearity_fit(
+        self, zeroed: bool = False, series: bool = False, linear_range: float = 0.0
+    ) -> pd.DataFrame:
+        """Fit angle against mean raw output for every sensor in one pass.
+
+        Returns the mean, max and min residuals (predicted - set angle) at each
+        angle along with each sensor's ``slope``, ``intercept`` and ``r2``.
+        With ``series`` the residuals are combined per sensor group and the fit
+        columns describe the group's averaged linearity.
+        """
+        df = self.linearity(zeroed).reset_index()
+        if linear_range > 0:
+            df = df.loc[df["angle"].abs() <= linear_range]
+
+        fit = linear_fit(df["mean_raw"], df["angle"], df["sensor_name"])
+        coef = fit.reindex(df["sensor_name"])
+        for stat in ("mean", "max", "min"):
+            df[f"{stat}_residual"] = (
+                coef["slope"].to_numpy() * df[f"{stat}_raw"].to_numpy()
+                + coef["intercept"].to_numpy()
+                - df["angle"].to_numpy()
+            )
+        residuals = ["mean_residual", "max_residual", "min_residual"]
+
+        if not series:
+            df = df.join(fit, on="sensor_name")
+            return df.set_index(["angle", "sensor_name"])[residuals + list(fit.columns)]
+
+        df["series"] = df["sensor_name"].map(self.series_mapping)
+        gb = df.groupby(["angle", "series"], observed=True)
+        lindf = gb["mean_residual"].mean().to_frame()
+        lindf["max_residual"] = gb["max_residual"].max()
+        lindf["min_residual"] = gb["min_residual"].min()
+
+        group_df = self.linearity(zeroed, series=True).reset_index()
+        if linear_range > 0:
+            group_df = group_df.loc[group_df["angle"].abs() <= linear_range]
+        fit = linear_fit(group_df["mean_raw"], group_df["angle"], group_df["series"])
+
+        return lindf.join(fit, on="series")
 
-        aggregate_query = [
-            _self._match_query,
+    def _repeatability_query(self, dropped_rows: int) -> list[dict]:
+        return [
+            self._match_query,
             {"$skip": dropped_rows},
             {
                 "$project": {
@@ -399,121 +689,107 @@ class SensorData:
                 }
             },
             {"$addFields": {"repeatability": {"$divide": ["$range", 2]}}},
+            *FLATTEN_ID,
         ]
 
-        df = pd.DataFrame(list(db["sample"].aggregate(aggregate_query)))
-        df = df.drop("_id", axis=1).join(pd.DataFrame(df["_id"].tolist()))
-        return df
+    @cached()
+    def _repeatability(self, dropped_rows: int) -> pd.DataFrame:
+        if dropped_rows == 0:
+            df = self._angle_stats()[
+                ["max_degrees", "min_degrees", "angle", "sensor_name"]
+            ].copy()
+            df["range"] = df["max_degrees"] - df["min_degrees"]
+            df["repeatability"] = df["range"] / 2
+            return df
+
+        samples = self._local_samples(["set_angle", "sensor_name", "degrees"])
+        if samples is not None:
+            return local.repeatability(samples, dropped_rows)
+
+        return aggregate_frame(
+            "sample", self._repeatability_query(dropped_rows), REPEATABILITY_FIELDS
+        )
 
+    @compacted
     def repeatability(
         self, zeroed: bool = False, series: bool = False, dropped_rows: int = 0
     ) -> pd.DataFrame:
         df = self._repeatability(dropped_rows=dropped_rows).copy()
 
         if zeroed:
-            df["zero"] = df["sensor_name"].map(self.zeroes)
+            df["zero"] = df["sensor_name"].map(self.zeroes).astype(float)
             df["angle"] = df["angle"] - df["zero"]
 
         if series:
             df["series"] = df["sensor_name"].map(self.series_mapping)
             round_column(df, "angle", self.set_angles)
-            new_df = (
-                df.groupby(["series", "angle"])
-                .mean(numeric_only=True)[["repeatability"]]
-                .reset_index()
-            )
-            new_df.rename(columns={"repeatability": "mean_repeatability"}, inplace=True)
-            new_df["max_repeatability"] = (
-                df.groupby(["series", "angle"])
-                .max()[["repeatability"]]
-                .reset_index()["repeatability"]
-            )
-            new_df["min_repeatability"] = (
-                df.groupby(["series", "angle"])
-                .min()[["repeatability"]]
-                .reset_index()["repeatability"]
-            )
-            df = new_df
+            gb = df.groupby(["series", "angle"], observed=True)["repeatability"]
+            df = gb.agg(
+                mean_repeatability="mean",
+                max_repeatability="max",
+                min_repeatability="min",
+            ).reset_index()
 
         return df
 
-    @st.cache_data(ttl=60)
-    def repeatability_residuals(_self) -> pd.DataFrame:
-        db = mongo_tilt_db()
-
-        aggregate_query = [
-            _self._match_query,
+    @property
+    def _residual_sample_query(self) -> list[dict]:
+        return [
+            self._match_query,
             {
                 "$project": {
-                    "angle": {"$round": ["$stage_data.set_angle", 6]},
-                    "degrees": "$sensor_data.degrees",
-                    "sensor_name": 1,
+                    "_id": 0,
                     "sample_time": 1,
-                }
-            },
-            {
-                "$group": {
-                    "_id": {
-                        "angle": "$angle",
-                        "sensor_name": "$sensor_name",
-                    },
-                    "avg_degrees": {"$avg": "$degrees"},
-                    "samples": {"$push": "$$ROOT"},
-                }
-            },
-            {"$unwind": "$samples"},
-            {
-                "$project": {
-                    "sample_time": "$samples.sample_time",
-                    "sensor_name": "$samples.sensor_name",
-                    "set_angle": "$samples.angle",
-                    "sensor_degrees": "$samples.degrees",
-                    "residual": {
-                        "$subtract": [
-                            "$samples.degrees",
-                            "$avg_degrees",
-                        ]
-                    },
+                    "sensor_name": 1,
+                    "set_angle": {"$round": ["$stage_data.set_angle", 6]},
+                    "sensor_degrees": "$sensor_data.degrees",
                 }
             },
         ]
 
-        df = pd.DataFrame(list(db["sample"].aggregate(aggregate_query)))
-        return df
+    @cached()
+    def repeatability_residuals(self) -> pd.DataFrame:
+        """Each sample's offset from its sensor's mean output at that angle.
 
-    @property
-    @st.cache_data(ttl=60)
-    def accuracy(_self) -> pd.DataFrame:
-        db = mongo_tilt_db()
+        The per-angle means come from _angle_stats and the samples are
+        streamed separately, so the server never holds a group's samples in
+        memory.
+        """
+        samples = self._local_samples(
+            ["sample_time", "set_angle", "sensor_name", "degrees"]
+        )
+        if samples is not None:
+            return local.repeatability_residuals(samples)
 
-        aggregate_query = [
-            _self._match_query,
+        df = aggregate_frame(
+            "sample",
+            self._residual_sample_query,
             {
-                "$addFields": {
-                    "error": {
-                        "$sum": [
-                            "$stage_data.stage_angle",
-                            {"$multiply": [-1, "$sensor_data.degrees"]},
-                        ]
-                    }
-                }
+                "sample_time": DATETIME,
+                "sensor_name": CATEGORY,
+                "set_angle": FLOAT,
+                "sensor_degrees": FLOAT,
             },
-            {
-                "$group": {
-                    "_id": {
-                        "angle": "$stage_data.set_angle",
-                        "sensor_name": "$sensor_name",
-                    },
-                    "max_error": {"$max": "$error"},
-                    "min_error": {"$min": "$error"},
-                    "mean_error": {"$avg": "$error"},
-                    "dev_error": {"$stdDevSamp": "$error"},
-                }
-            },
-        ]
-
-        df = pd.DataFrame(list(db["sample"].aggregate(aggregate_query)))
-        df.info()
-        df = df.drop("_id", axis=1).join(pd.DataFrame(df["_id"].tolist()))
+        )
+        if df.empty:
+            return df
 
+        means = self._angle_stats()[["angle", "sensor_name", "mean_degrees"]]
+        means = means.rename(columns={"angle": "set_angle"})
+        df = df.merge(means, on=["set_angle", "sensor_name"], how="left")
+        df["residual"] = df["sensor_degrees"] - df.pop("mean_degrees")
         return df
+
+    @property
+    @compacted
+    def accuracy(self) -> pd.DataFrame:
+        return self._angle_stats()[
+            [
+                "max_error",
+                "min_error",
+                "mean_error",
+                "dev_error",
+                "angle",
+                "sensor_name",
+            ]
+        ]
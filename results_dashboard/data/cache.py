@@ -0,0 +1,529 @@
+import functools
+import inspect
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Hashable
+
+import pandas as pd
+import streamlit as st
+
+from . import perf, schema
+from .mongo import budgets, query_pool
+from .shared_cache import SQLiteCache
+
+DEFAULT_TTL = 60
+# concurrent misses on one key wait for a single computation
+COALESCE = bool(st.secrets.get("coalesce_queries", True))
+# results past their TTL are served while a background thread recomputes
+# them, for up to this much longer; after that callers wait as on a miss
+STALE_WHILE_REVALIDATE = bool(st.secrets.get("stale_while_revalidate", True))
+STALE_SECONDS = float(st.secrets.get("stale_seconds", 3600))
+# a result that ran past its query budget isn't queried again for this long
+BUDGET_RETRY_SECONDS = float(st.secrets.get("query_budget_retry_seconds", 300))
+# a page waiting longer than this for a result shows it in the sidebar
+WAIT_NOTICE_SECONDS = 1
+WAIT_POLL_SECONDS = 0.25
+
+logger = logging.getLogger(__name__)
+
+
+def _size_of(value: Any) -> int:
+    """Approximate in-memory size of a cached result in bytes."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(sys.getsizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def _copy(value: Any) -> Any:
+    """Copy mutable results so callers can't modify the cached value."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+    if isinstance(value, (list, dict, set)):
+        return value.copy()
+    return value
+
+
+class ResultCache:
+    """Thread-safe LRU cache bounded by an approximate memory budget."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[
+            Hashable, tuple[Any, int, float | None, float]
+        ] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def get(self, key: Hashable) -> tuple[bool, Any, float | None]:
+        """Return ``(hit, value, stored)`` for a key, dropping it if it has expired.
+
+        ``stored`` is the wall-clock time the value was computed.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return False, None, None
+
+            value, size, expires, stored = entry
+            if expires is not None and expires < time.monotonic():
+                self._remove(key)
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return False, None, None
+
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return True, value, stored
+
+    def set(
+        self, key: Hashable, value: Any, ttl: float | None, stored: float | None = None
+    ) -> int:
+        """Store a value, expiring it after ``ttl`` seconds (never if None).
+
+        ``stored`` is when the value was computed, now if None. Returns the
+        value's approximate size in bytes.
+        """
+        size = _size_of(value)
+        if size > self.max_bytes:
+            # a single result bigger than the whole budget is never cached
+            return size
+
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires, stored or time.time())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+        return size
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+class TieredCache:
+    """A process's memory cache in front of a cache shared between processes.
+
+    Results computed by any process are served to the others from the shared
+    tier, then kept in memory until they expire there.
+    """
+
+    def __init__(self, memory: ResultCache, shared: SQLiteCache):
+        self.memory = memory
+        self.shared = shared
+
+    def get(self, key: Hashable) -> tuple[bool, Any, float | None]:
+        hit, value, stored = self.memory.get(key)
+        if hit:
+            return True, value, stored
+        hit, value, expires, stored = self.shared.get(key)
+        if hit:
+            ttl = None if expires is None else max(expires - time.time(), 0)
+            self.memory.set(key, value, ttl=ttl, stored=stored)
+        return hit, value, stored
+
+    def set(
+        self, key: Hashable, value: Any, ttl: float | None, stored: float | None = None
+    ) -> int:
+        stored = stored or time.time()
+        self.shared.set(key, value, ttl=ttl, stored=stored)
+        return self.memory.set(key, value, ttl=ttl, stored=stored)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        self.shared.clear()
+
+    def stats(self) -> dict[str, int]:
+        shared = {
+            f"shared_{name}": value for name, value in self.shared.stats().items()
+        }
+        return {**self.memory.stats(), **shared}
+
+
+def _make_cache(backend: str) -> ResultCache | TieredCache:
+    memory = ResultCache(
+        max_bytes=int(st.secrets.get("sensor_cache_max_mb", 512)) * 2**20,
+    )
+    if backend == "memory":
+        return memory
+    if backend == "sqlite":
+        shared = SQLiteCache(
+            Path(st.secrets.get("shared_cache_path", ".result_cache/results.sqlite")),
+            max_bytes=int(st.secrets.get("shared_cache_max_mb", 4096)) * 2**20,
+        )
+        return TieredCache(memory, shared)
+    raise ValueError(f"Unknown cache_backend {backend!r}, expected memory or sqlite")
+
+
+class SingleFlight:
+    """Run one call per key at a time; callers arriving meanwhile share it.
+
+    Sessions that open the same selection together then issue one query
+    instead of one each. Followers get the leader's result, or its exception.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, Future] = {}
+        self._waiters: dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key: Hashable) -> tuple[Future, bool]:
+        # called with the lock held; the caller must ``leave`` afterwards
+        call = self._calls.get(key)
+        shared = call is not None
+        if not shared:
+            call = self._calls[key] = Future()
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        return call, shared
+
+    def leave(self, key: Hashable) -> None:
+        """Stop waiting for a call joined with ``start``."""
+        with self._lock:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    def start(
+        self, key: Hashable, func: Callable[[], Any], executor: Executor
+    ) -> tuple[Future, bool]:
+        """Join the call for ``key``, running ``func`` on ``executor`` if none is.
+
+        Returns ``(call, shared)``. The caller counts as waiting for the call
+        until it calls ``leave``.
+        """
+        with self._lock:
+            call, shared = self._join(key)
+        if not shared:
+            executor.submit(self._run, key, call, func)
+        return call, shared
+
+    def do(
+        self,
+        key: Hashable,
+        func: Callable[[], Any],
+        executor: Executor | None = None,
+        wait: Callable[[Future], Any] = Future.result,
+    ) -> tuple[Any, bool]:
+        """Return ``(result, shared)``, ``shared`` if another caller ran it.
+
+        With an ``executor`` the call runs there while this caller waits with
+        ``wait``, which may give up without stopping the call.
+        """
+        if executor is not None:
+            call, shared = self.start(key, func, executor)
+        else:
+            with self._lock:
+                call, shared = self._join(key)
+        try:
+            if shared or executor is not None:
+                return wait(call), shared
+            return self._run(key, call, func), False
+        finally:
+            self.leave(key)
+
+    def abandoned(self, key: Hashable) -> bool:
+        """Whether every caller waiting for ``key`` has given up."""
+        with self._lock:
+            return key not in self._waiters
+
+    def spawn(self, key: Hashable, func: Callable[[], Any], executor: Executor) -> bool:
+        """Run ``func`` on ``executor`` unless a call for ``key`` is running.
+
+        Returns whether it was started. Callers of ``do`` meanwhile share it.
+        """
+        with self._lock:
+            if key in self._calls:
+                return False
+            call = self._calls[key] = Future()
+        executor.submit(self._run, key, call, func)
+        return True
+
+    def _run(self, key: Hashable, call: Future, func: Callable[[], Any]) -> Any:
+        try:
+            result = func()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+# "sqlite" shares results between the server processes on a host
+sensor_cache = _make_cache(st.secrets.get("cache_backend", "memory"))
+flights = SingleFlight()
+# kept apart from the query pool so refreshes never delay a page's own queries
+refresh_pool = ThreadPoolExecutor(
+    max_workers=int(st.secrets.get("refresh_workers", 2)),
+    thread_name_prefix="refresh",
+)
+# keys whose computation ran past its budget, with until when and why
+_over_budget: dict[Hashable, tuple[float, str]] = {}
+_over_budget_lock = threading.Lock()
+# calls started by ``prefetching`` as (name, flight, call), while it's active
+_prefetching: ContextVar[list | None] = ContextVar("prefetching", default=None)
+
+
+def _budget_exceeded(key: Hashable) -> str | None:
+    """Why ``key`` recently ran past its budget, or None."""
+    with _over_budget_lock:
+        until, reason = _over_budget.get(key, (0.0, ""))
+    return reason if until > time.monotonic() else None
+
+
+def _mark_over_budget(key: Hashable, reason: str) -> None:
+    now = time.monotonic()
+    with _over_budget_lock:
+        for expired in [k for k, (until, _) in _over_budget.items() if until <= now]:
+            del _over_budget[expired]
+        if key not in _over_budget:
+            _over_budget[key] = (now + BUDGET_RETRY_SECONDS, reason)
+
+
+def _wait(call: Future, name: str) -> Any:
+    """Wait on a page's script thread, showing how long ``name`` is taking.
+
+    Updating the notice hands control to Streamlit, which raises there when a
+    rerun has superseded the page. The wait then ends, and the call is left
+    to notice nobody waits for it any more.
+    """
+    start = time.monotonic()
+    notice = None
+    shown = 0
+    while True:
+        try:
+            result = call.result(timeout=WAIT_POLL_SECONDS)
+        except FutureTimeout:
+            waited = int(time.monotonic() - start)
+            if waited >= WAIT_NOTICE_SECONDS and waited != shown:
+                notice = notice or st.sidebar.empty()
+                notice.caption(f"Waiting for {name}: {waited} s")
+                shown = waited
+            continue
+        except BaseException:
+            if notice is not None:
+                notice.empty()
+            raise
+        if notice is not None:
+            notice.empty()
+        return result
+
+
+@contextmanager
+def prefetching():
+    """Start cached methods called inside on the query pool without waiting.
+
+    The calls return None at once unless their result is cached. Yields the
+    started calls; pass them to ``wait_for``, which this caller keeps
+    counting as waiting on until it returns.
+    """
+    pending = []
+    token = _prefetching.set(pending)
+    try:
+        yield pending
+    finally:
+        _prefetching.reset(token)
+
+
+def wait_for(pending: list) -> None:
+    """Wait for calls started by ``prefetching`` as a page waits for its own.
+
+    A rerun can stop the wait, and calls nobody else waits for are then
+    cancelled. Their errors are left for the page's own calls to raise.
+    """
+    try:
+        for name, _, call in pending:
+            if perf.on_page_thread():
+                try:
+                    _wait(call, name)
+                except Exception:
+                    pass
+            else:
+                call.exception()
+    finally:
+        for _, flight, _ in pending:
+            flights.leave(flight)
+
+
+def cached(
+    ttl: float | None = DEFAULT_TTL,
+    cache: ResultCache | TieredCache = sensor_cache,
+    fallback: Callable | None = None,
+):
+    """Cache a ``SensorData`` method on its selection, name and arguments.
+
+    The key is built from ``self.cache_key`` so results for different test or
+    sensor selections never collide, and from the bound call arguments so
+    ``f(1)`` and ``f(x=1)`` share an entry. Concurrent misses on a key are
+    coalesced, so only the first caller computes the result.
+
+    Results are fresh for ``self.cache_ttl(ttl)`` seconds, forever if None.
+    A stale result is returned at once and recomputed in the background.
+
+    Queries run on the method's budget (see ``mongo.budgets``). A page's
+    queries run on the query pool while the page waits, so a rerun can stop
+    the wait, and they are cancelled once no page waits for them. If one runs
+    past its budget ``fallback(self, ...)`` is returned instead with a notice,
+    unless it returns None; then the page stops with a warning. Inside
+    ``prefetching`` a miss only starts the query.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            params = tuple(bound.arguments.items())[1:]
+            key = (self.cache_key, func.__qualname__, params)
+            name = f"SensorData.{func.__name__}"
+            fresh = self.cache_ttl(ttl)
+
+            def store(value: Any) -> int:
+                keep = fresh
+                if fresh is not None and STALE_WHILE_REVALIDATE:
+                    keep = fresh + STALE_SECONDS
+                return cache.set(key, value, ttl=keep)
+
+            def compute(cancelled: Callable[[], bool] | None = None):
+                # methods this one calls wait for their results
+                _prefetching.set(None)
+                # a flight may have filled the cache since the first lookup
+                hit, value, _ = cache.get(key)
+                if not hit:
+                    try:
+                        with budgets.budget(name, cancelled):
+                            value = schema.compact(func(self, *args, **kwargs))
+                    except budgets.QueryBudgetExceeded as e:
+                        # so callers sharing or following this call fall back
+                        _mark_over_budget(key, str(e))
+                        raise
+                    s.bytes = store(value)
+                return value, hit
+
+            def start(pending: list) -> str:
+                flight = key if COALESCE else (key, object())
+                call, shared = flights.start(
+                    flight,
+                    perf.bound(
+                        functools.partial(compute, lambda: flights.abandoned(flight))
+                    ),
+                    query_pool,
+                )
+                pending.append((name, flight, call))
+                return "shared" if shared else "miss"
+
+            def refresh() -> tuple[Any, bool]:
+                with perf.span("refresh", name) as r:
+                    try:
+                        with budgets.budget(name):
+                            value = schema.compact(func(self, *args, **kwargs))
+                    except Exception as e:
+                        logger.exception("Refreshing %s failed", name)
+                        if isinstance(e, budgets.QueryBudgetExceeded):
+                            # keep serving the stale result rather than retrying
+                            _mark_over_budget(key, str(e))
+                        raise
+                    r.bytes = store(value)
+                    return value, False
+
+            def fetch() -> tuple[Any, str]:
+                # without coalescing every call gets a flight of its own
+                flight = key if COALESCE else (key, object())
+                while True:
+                    try:
+                        if perf.on_page_thread():
+                            (value, hit), shared = flights.do(
+                                flight,
+                                perf.bound(
+                                    functools.partial(
+                                        compute, lambda: flights.abandoned(flight)
+                                    )
+                                ),
+                                query_pool,
+                                functools.partial(_wait, name=name),
+                            )
+                        else:
+                            (value, hit), shared = flights.do(flight, compute)
+                        return value, "shared" if shared else "hit" if hit else "miss"
+                    except budgets.QueryCancelled:
+                        if budgets.cancelled():
+                            raise
+                        # the page running it went away; run it for this caller
+
+            with perf.span("method", name) as s:
+                hit, value, stored = cache.get(key)
+                if hit:
+                    s.age = time.time() - stored
+                    s.cache = "hit"
+                    if fresh is not None and s.age > fresh:
+                        # only kept past its TTL to be served while it refreshes
+                        s.cache = "stale"
+                        if _budget_exceeded(key) is None:
+                            flights.spawn(key, refresh, refresh_pool)
+                elif _prefetching.get() is not None:
+                    if _budget_exceeded(key) is None:
+                        s.cache = start(_prefetching.get())
+                    return None
+                else:
+                    try:
+                        reason = _budget_exceeded(key)
+                        if reason is not None:
+                            raise budgets.QueryBudgetExceeded(reason)
+                        value, s.cache = fetch()
+                    except budgets.QueryBudgetExceeded as e:
+                        _mark_over_budget(key, str(e))
+                        value = fallback(self, *args, **kwargs) if fallback else None
+                        if value is None:
+                            notice = f"{e}. Try fewer tests or a shorter time window."
+                            if perf.on_page_thread():
+                                st.warning(notice)
+                                st.stop()
+                            raise budgets.QueryBudgetExceeded(notice) from e
+                        value = schema.compact(value)
+                        s.cache = "fallback"
+                        s.notice = f"{e}, so a cheaper summary is shown."
+                s.rows = perf.rows_of(value)
+                return _copy(value)
+
+        return wrapper
+
+    return decorator
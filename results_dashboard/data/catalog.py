@@ -0,0 +1,99 @@
+"""Process-wide catalog of tests for the test selector.
+
+The catalog is loaded once, then refreshed incrementally: each refresh only
+fetches tests started at or after the newest start time already held, plus
+the tests still running, whose progress and row counts change. Searching and
+paging happen here rather than in the browser, so the selector only ever
+receives one page of labels.
+"""
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+
+from .mongo import tests_db
+
+CATALOG_REFRESH_SECONDS = float(st.secrets.get("catalog_refresh_seconds", 30))
+# a full reload also drops tests deleted since the catalog was loaded
+CATALOG_RELOAD_SECONDS = float(st.secrets.get("catalog_reload_seconds", 3600))
+CATALOG_PAGE_SIZE = int(st.secrets.get("catalog_page_size", 50))
+
+
+class TestCatalog:
+    """Label, progress, rows written and start time of every test."""
+
+    def __init__(self, refresh_seconds: float, reload_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self.reload_seconds = reload_seconds
+        self._tests: pd.DataFrame | None = None
+        self._complete: frozenset[str] = frozenset()
+        self._refreshed = 0.0
+        self._loaded = 0.0
+        self._lock = threading.Lock()
+
+    def _merge(self, new: pd.DataFrame) -> None:
+        tests = pd.concat([self._tests, new]).drop_duplicates("_id", keep="last")
+        self._set_tests(
+            tests.sort_values(
+                "test_start_time", ascending=False, kind="stable"
+            ).reset_index(drop=True)
+        )
+
+    def _set_tests(self, tests: pd.DataFrame) -> None:
+        self._tests = tests
+        self._complete = frozenset(tests.loc[tests["progress"] >= 1, "_id"])
+
+    def refresh(self, force: bool = False) -> pd.DataFrame:
+        """Bring the catalog up to date if it is older than the refresh interval."""
+        with self._lock:
+            now = time.monotonic()
+            if self._tests is None or now - self._loaded > self.reload_seconds:
+                self._set_tests(tests_db.get_catalog())
+                self._loaded = self._refreshed = now
+            elif force or now - self._refreshed > self.refresh_seconds:
+                tests = self._tests
+                since = tests["test_start_time"].max() if len(tests) else None
+                running = tests.loc[tests["progress"] < 1, "_id"].tolist()
+                if pd.isna(since):
+                    since = None
+                if since is not None or running:
+                    self._merge(tests_db.get_catalog(since, running))
+                self._refreshed = now
+            return self._tests
+
+    def _matches(self, text: str) -> pd.DataFrame:
+        tests = self.refresh()
+        tests = tests[(tests["rows_written"] > 0) & tests["label"].notna()]
+        if text:
+            tests = tests[tests["label"].str.contains(text, case=False, regex=False)]
+        return tests
+
+    def count(self, text: str = "") -> int:
+        """How many tests with samples have a label containing ``text``."""
+        return len(self._matches(text))
+
+    def search(
+        self, text: str = "", page: int = 0, page_size: int = CATALOG_PAGE_SIZE
+    ) -> pd.DataFrame:
+        """One page of the tests with samples whose label contains ``text``."""
+        start = page * page_size
+        return self._matches(text).iloc[start : start + page_size].copy()
+
+    def tests(self, test_ids: list[str]) -> pd.DataFrame:
+        """Catalog rows for ``test_ids``, newest first."""
+        tests = self.refresh()
+        return tests[tests["_id"].isin([str(test_id) for test_id in test_ids])].copy()
+
+    def complete(self, test_ids: list[str]) -> bool:
+        """Whether every one of ``test_ids`` had finished at the last refresh."""
+        self.refresh()
+        complete = self._complete
+        return bool(test_ids) and all(str(test_id) in complete for test_id in test_ids)
+
+    def labels(self, test_ids: list[str]) -> dict[str, str]:
+        tests = self.tests(test_ids)
+        return dict(zip(tests["_id"], tests["label"]))
+
+
+test_catalog = TestCatalog(CATALOG_REFRESH_SECONDS, CATALOG_RELOAD_SECONDS)
@@ -0,0 +1,308 @@
+"""Decode raw BSON batches straight into columnar arrays.
+
+``pd.DataFrame(list(cursor))`` builds a dict per document and then boxes
+every value again while inferring columns. For the known flat fields of a
+projection the raw batch bytes are instead walked one element at a time
+across every document at once with NumPy, and the values are copied into
+preallocated arrays with strings stored as categorical codes. pymongoarrow
+does the same in C and is used when it is installed.
+"""
+import struct
+from typing import Iterable
+
+import bson
+import numpy as np
+import pandas as pd
+from bson.datetime_ms import DatetimeMS
+
+from . import perf
+from .mongo import aggregate_raw_batches, budgets, mongo_tilt_db
+
+try:
+    import pyarrow as pa
+    from pymongoarrow.api import Schema
+    from pymongoarrow.context import PyMongoArrowContext
+except ImportError:
+    PyMongoArrowContext = None
+
+FLOAT = "float"
+DATETIME = "datetime"
+CATEGORY = "category"
+
+_STORAGE = {FLOAT: np.float64, DATETIME: np.int64, CATEGORY: np.int32}
+_NAT = np.iinfo(np.int64).min
+
+# BSON element types
+_MISSING = 0x00  # also the end-of-document marker
+_DOUBLE = 0x01
+_STRING = 0x02
+_DATETIME = 0x09
+_NULL = 0x0A
+_INT32 = 0x10
+_INT64 = 0x12
+
+# value sizes by element type; -1 is unsupported, -2 is read from a length
+# prefix (plus _PREFIX_EXTRA bytes)
+_SIZES = np.full(256, -1, dtype=np.int64)
+for _types, _size in (
+    ((0x06, 0x0A, 0x7F, 0xFF), 0),
+    ((0x08,), 1),
+    ((0x10,), 4),
+    ((0x01, 0x09, 0x11, 0x12), 8),
+    ((0x07,), 12),
+    ((0x13,), 16),
+    ((0x02, 0x03, 0x04, 0x05, 0x0D, 0x0E), -2),
+):
+    _SIZES[list(_types)] = _size
+_PREFIX_EXTRA = np.zeros(256, dtype=np.int64)
+_PREFIX_EXTRA[[0x02, 0x0D, 0x0E]] = 4
+_PREFIX_EXTRA[0x05] = 5
+
+# keys longer than this send a batch down the dict path
+_KEY_WINDOW = 32
+_int32 = struct.Struct("<i").unpack_from
+
+
+def _grow(array: np.ndarray, capacity: int) -> np.ndarray:
+    grown = np.empty(capacity, dtype=array.dtype)
+    grown[: len(array)] = array
+    return grown
+
+
+def _gather(data: np.ndarray, positions: np.ndarray, width: int) -> np.ndarray:
+    """``width`` bytes starting at each position, one row per position."""
+    return np.lib.stride_tricks.sliding_window_view(data, width)[positions]
+
+
+def _read(data: np.ndarray, positions: np.ndarray, dtype: str) -> np.ndarray:
+    width = np.dtype(dtype).itemsize
+    return _gather(data, positions, width).view(dtype).ravel()
+
+
+def _doc_starts(batch: bytes) -> np.ndarray:
+    starts = []
+    pos = 0
+    end = len(batch)
+    while pos < end:
+        starts.append(pos)
+        pos += _int32(batch, pos)[0]
+    return np.array(starts, dtype=np.int64)
+
+
+def _locate(
+    data: np.ndarray, starts: np.ndarray, names: list[str]
+) -> dict[str, tuple[np.ndarray, np.ndarray]] | None:
+    """Element type and value offset of each named field in every document.
+
+    Documents are walked in lockstep, one element per step, so the number of
+    steps is the number of fields rather than documents. Returns None if a
+    document has an element the walk can't size.
+    """
+    size = len(starts)
+    keys = {name: np.frombuffer(name.encode() + b"\0", np.uint8) for name in names}
+    located = {
+        name: (np.zeros(size, dtype=np.uint8), np.zeros(size, dtype=np.int64))
+        for name in names
+    }
+
+    docs = np.arange(size)
+    pos = starts + 4
+    while docs.size:
+        types = data[pos]
+        more = types != _MISSING
+        docs, pos, types = docs[more], pos[more], types[more]
+        if not docs.size:
+            break
+
+        # documents of a projection nearly always share their key order, so
+        # every key is first compared with the first document's
+        head = data[pos[0] + 1 : pos[0] + 1 + _KEY_WINDOW]
+        if not (head == 0).any():
+            return None
+        first = head[: np.flatnonzero(head == 0)[0] + 1]
+        same = (_gather(data, pos + 1, len(first)) == first).all(axis=1)
+        key_len = np.full(len(docs), len(first) - 1)
+        matches = {bytes(first[:-1]).decode(errors="replace"): same}
+
+        rest = np.flatnonzero(~same)
+        if rest.size:
+            window = _gather(data, pos[rest] + 1, _KEY_WINDOW)
+            terminated = window == 0
+            if not terminated.any(axis=1).all():
+                return None
+            key_len[rest] = terminated.argmax(axis=1)
+            for name, key in keys.items():
+                match = key_len[rest] == len(key) - 1
+                match[match] = (window[match, : len(key)] == key).all(axis=1)
+                matches.setdefault(name, np.zeros(len(docs), dtype=bool))
+                matches[name][rest[match]] = True
+
+        value_pos = pos + key_len + 2
+        for name, match in matches.items():
+            if name in located:
+                located[name][0][docs[match]] = types[match]
+                located[name][1][docs[match]] = value_pos[match]
+
+        sizes = _SIZES[types]
+        if (sizes == -1).any():
+            return None
+        prefixed = sizes == -2
+        if prefixed.any():
+            sizes[prefixed] = (
+                _read(data, value_pos[prefixed], "<i4") + _PREFIX_EXTRA[types[prefixed]]
+            )
+        pos = value_pos + sizes
+
+    return located
+
+
+def _fill_raw(
+    out: np.ndarray,
+    data: np.ndarray,
+    types: np.ndarray,
+    positions: np.ndarray,
+    kind: str,
+    lookup: dict,
+) -> bool:
+    """Copy one located field into ``out``. False if it holds unexpected types."""
+    if kind == FLOAT:
+        readers = {_DOUBLE: "<f8", _INT32: "<i4", _INT64: "<i8"}
+        out[:] = np.nan
+    elif kind == DATETIME:
+        readers = {_DATETIME: "<i8"}
+        out[:] = _NAT
+    else:
+        readers = {_STRING: None}
+        out[:] = -1
+    if not np.isin(types, [_MISSING, _NULL, *readers]).all():
+        return False
+
+    for element_type, dtype in readers.items():
+        rows = np.flatnonzero(types == element_type)
+        if not rows.size:
+            continue
+        if dtype is not None:
+            out[rows] = _read(data, positions[rows], dtype)
+            continue
+
+        # strings: pad to the longest, dedupe the bytes, then decode uniques
+        lengths = _read(data, positions[rows], "<i4") - 1
+        width = max(int(lengths.max()), 1)
+        raw = _gather(data, positions[rows] + 4, width)
+        raw[np.arange(width) >= lengths[:, None]] = 0
+        uniques, inverse = np.unique(
+            np.ascontiguousarray(raw).view(f"S{width}").ravel(), return_inverse=True
+        )
+        codes = [
+            lookup.setdefault(value.decode(), len(lookup) - 1) for value in uniques
+        ]
+        out[rows] = np.asarray(codes, dtype=out.dtype)[inverse.ravel()]
+    return True
+
+
+def _fill_docs(out: np.ndarray, docs: list[dict], name: str, kind: str, lookup: dict):
+    values = [doc.get(name) for doc in docs]
+    if kind == FLOAT:
+        # None converts to NaN
+        out[:] = np.array(values, dtype=np.float64)
+    elif kind == DATETIME:
+        out[:] = [_NAT if value is None else int(DatetimeMS(value)) for value in values]
+    else:
+        out[:] = [lookup.setdefault(value, len(lookup) - 1) for value in values]
+
+
+def decode_batches(
+    batches: Iterable[bytes], fields: dict[str, str], size_hint: int = 0
+) -> pd.DataFrame:
+    """Columns of ``fields`` (name -> FLOAT, DATETIME or CATEGORY) from raw batches.
+
+    Missing or null values become NaN, NaT or a missing category. Batches the
+    columnar walk can't handle are decoded to dicts instead.
+    """
+    capacity = max(size_hint, 1)
+    arrays = {
+        name: np.empty(capacity, dtype=_STORAGE[kind]) for name, kind in fields.items()
+    }
+    # None is pre-seeded so missing strings get the categorical "missing" code
+    lookups = {name: {None: -1} for name, kind in fields.items() if kind == CATEGORY}
+
+    size = 0
+    for batch in batches:
+        data = np.frombuffer(batch + bytes(_KEY_WINDOW), np.uint8)
+        starts = _doc_starts(batch)
+        end = size + len(starts)
+        if end > capacity:
+            capacity = max(end, capacity * 2)
+            arrays = {
+                name: _grow(array[:size], capacity) for name, array in arrays.items()
+            }
+
+        located = _locate(data, starts, list(fields))
+        filled = located is not None and all(
+            _fill_raw(
+                arrays[name][size:end],
+                data,
+                *located[name],
+                kind,
+                lookups.get(name),
+            )
+            for name, kind in fields.items()
+        )
+        if not filled:
+            docs = bson.decode_all(batch)
+            for name, kind in fields.items():
+                _fill_docs(arrays[name][size:end], docs, name, kind, lookups.get(name))
+        size = end
+
+    columns = {}
+    for name, kind in fields.items():
+        array = arrays[name][:size]
+        if kind == DATETIME:
+            columns[name] = array.view("datetime64[ms]").astype("datetime64[ns]")
+        elif kind == CATEGORY:
+            categories = [value for value in lookups[name] if value is not None]
+            columns[name] = pd.Categorical.from_codes(array, categories)
+        else:
+            columns[name] = array
+    return pd.DataFrame(columns)
+
+
+def _arrow_frame(
+    collection: str, pipeline: list[dict], fields: dict[str, str], **kwargs
+):
+    types = {FLOAT: pa.float64(), DATETIME: pa.timestamp("ms"), CATEGORY: pa.string()}
+    schema = Schema({name: types[kind] for name, kind in fields.items()})
+    context = PyMongoArrowContext(
+        schema, codec_options=mongo_tilt_db()[collection].codec_options
+    )
+    # the batches are fetched here rather than by aggregate_arrow_all so a
+    # cancelled page or spent budget stops the cursor between them
+    for batch in budgets.cancellable(
+        aggregate_raw_batches(collection, pipeline, **kwargs)
+    ):
+        context.process_bson_stream(batch)
+    df = context.finish().to_pandas()
+    for name, kind in fields.items():
+        if kind == CATEGORY:
+            df[name] = df[name].astype("category")
+        elif kind == DATETIME:
+            df[name] = df[name].astype("datetime64[ns]")
+    return df
+
+
+def aggregate_frame(
+    collection: str, pipeline: list[dict], fields: dict[str, str], **kwargs
+) -> pd.DataFrame:
+    """Run an aggregation and decode its flat output fields into a DataFrame."""
+    with perf.span("decode", f"aggregate_frame({collection})") as s:
+        if PyMongoArrowContext is not None:
+            df = _arrow_frame(collection, pipeline, fields, **kwargs)
+        else:
+            df = decode_batches(
+                budgets.cancellable(
+                    aggregate_raw_batches(collection, pipeline, **kwargs)
+                ),
+                fields,
+            )
+        s.docs = s.rows = len(df)
+        return df
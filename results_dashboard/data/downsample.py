@@ -0,0 +1,72 @@
+"""Largest-Triangle-Three-Buckets downsampling for time-series charts."""
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# most points a chart is sent, split evenly between its series
+CHART_POINT_BUDGET = int(st.secrets.get("chart_point_budget", 4_000))
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the ``threshold`` points that best keep the shape of ``y``.
+
+    ``x`` must be sorted. The first and last points are always kept, and each
+    bucket in between keeps the point forming the largest triangle with the
+    previously kept point and the average of the next bucket.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    size = len(x)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+
+    # bucket i covers [edges[i], edges[i + 1]) of the points between the ends
+    edges = (np.arange(threshold - 1) * (size - 2) / (threshold - 2)).astype(int) + 1
+    edges[-1] = size - 1
+    # the average of each bucket's successor, ending with the last point
+    sums_x = np.add.reduceat(x[1:-1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:-1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    next_x = np.append(sums_x[1:] / counts[1:], x[-1])
+    next_y = np.append(sums_y[1:] / counts[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = size - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        area = np.abs(
+            (x[a] - next_x[i]) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (next_y[i] - y[a])
+        )
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def downsample(
+    df: pd.DataFrame,
+    x: str,
+    y: str,
+    budget: int = CHART_POINT_BUDGET,
+    by: str | None = None,
+) -> pd.DataFrame:
+    """Reduce each series of a frame to its share of ``budget`` points with LTTB.
+
+    Rows are sorted by ``x`` and rows without a ``y`` value are dropped.
+    """
+    df = df.dropna(subset=[y])
+    if len(df) <= budget:
+        return df
+
+    groups = [df] if by is None else [g for _, g in df.groupby(by, observed=True)]
+    threshold = max(budget // len(groups), 3)
+    frames = []
+    for group in groups:
+        group = group.sort_values(x, kind="stable")
+        xs = group[x].to_numpy()
+        if np.issubdtype(xs.dtype, np.datetime64):
+            xs = xs.astype("datetime64[ns]").view(np.int64)
+        frames.append(group.iloc[lttb_indices(xs, group[y].to_numpy(), threshold)])
+    return pd.concat(frames)
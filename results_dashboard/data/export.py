@@ -0,0 +1,126 @@
+import itertools
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from . import SensorData
+from .mongo import aggregate
+
+INFO_COLUMNS = [
+    "set_angle",
+    "stage_angle",
+    "oven_set_temperature",
+    "oven_integrated_temperature",
+    "thermocouple_temperature",
+    "ambient_temperature",
+]
+MEASUREMENT_COLUMNS = ["raw", "degrees", "pass_fail", "debug_info"]
+NUMERIC_COLUMNS = INFO_COLUMNS + ["raw", "degrees"]
+
+EXPORT_PROJECTION = {
+    "_id": 0,
+    "sensor_name": 1,
+    "sample_time": 1,
+    "set_angle": "$stage_data.set_angle",
+    "stage_angle": "$stage_data.stage_angle",
+    "oven_set_temperature": "$temperature_data.oven_set_temperature",
+    "oven_integrated_temperature": "$temperature_data.oven_integrated_temperature",
+    "thermocouple_temperature": "$temperature_data.thermocouple_temperature",
+    "ambient_temperature": "$temperature_data.ambient_temperature",
+    "raw": "$sensor_data.raw",
+    "degrees": "$sensor_data.degrees",
+    "pass_fail": "$sensor_data.pass_fail",
+    "debug_info": "$sensor_data.debug_info",
+}
+
+
+def _pivot(rows: list[dict], sensors: list[str]) -> pd.DataFrame:
+    """One row per sample_time with a column per measurement and sensor."""
+    df = pd.DataFrame(rows, columns=list(EXPORT_PROJECTION)[1:])
+    info_df = df.groupby("sample_time")[INFO_COLUMNS].first()
+
+    df = df.set_index(["sample_time", "sensor_name"])
+    df = df.loc[~df.index.duplicated(), MEASUREMENT_COLUMNS]
+    # reindex so every chunk has the same columns in the same order
+    data_df = df.unstack("sensor_name").reindex(
+        columns=pd.MultiIndex.from_tuples(
+            itertools.product(MEASUREMENT_COLUMNS, sensors)
+        )
+    )
+    data_df.columns = [f"{mtype}-{sensor}" for mtype, sensor in data_df.columns]
+
+    return pd.concat([info_df, data_df], axis=1)
+
+
+def _iter_chunks(data: SensorData, chunk_size: int):
+    """Pivoted frames of about ``chunk_size`` samples, in sample_time order.
+
+    A chunk only ends on a sample_time boundary so every row is complete.
+    """
+    sensors = sorted(data.sensor_names)
+    cursor = aggregate(
+        "sample",
+        [
+            data._match_query,
+            {"$sort": {"sample_time": 1}},
+            {"$project": EXPORT_PROJECTION},
+        ],
+        allowDiskUse=True,
+    )
+
+    rows = []
+    for row in cursor:
+        if len(rows) >= chunk_size and row["sample_time"] != rows[-1]["sample_time"]:
+            yield _pivot(rows, sensors)
+            rows = []
+        rows.append(row)
+    if rows:
+        yield _pivot(rows, sensors)
+
+
+def _parquet_table(df: pd.DataFrame) -> pa.Table:
+    df = df.reset_index()
+    for column in df.columns[1:]:
+        if column.split("-")[0] not in NUMERIC_COLUMNS:
+            df[column] = df[column].astype("string")
+        else:
+            df[column] = df[column].astype(float)
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def export_samples(
+    data: SensorData, path: str | Path, fmt: str = "csv", chunk_size: int = 50_000
+) -> int:
+    """Write a selection's samples to ``path`` as CSV or Parquet, chunk by chunk.
+
+    Peak memory depends on ``chunk_size`` rather than the size of the test.
+    Returns the number of rows written.
+    """
+    rows = 0
+    writer = None
+    try:
+        for i, chunk in enumerate(_iter_chunks(data, chunk_size)):
+            if fmt == "csv":
+                chunk.to_csv(path, mode="w" if i == 0 else "a", header=i == 0)
+            elif fmt == "parquet":
+                table = _parquet_table(chunk)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table.cast(writer.schema))
+            else:
+                raise ValueError(f"Unknown export format: {fmt}")
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def read_preview(path: str | Path, fmt: str = "csv", rows: int = 1_000) -> pd.DataFrame:
+    """The first rows of an export, without reading the whole file."""
+    if fmt == "csv":
+        return pd.read_csv(path, nrows=rows, index_col=0)
+    batches = pq.ParquetFile(path).iter_batches(batch_size=rows)
+    return next(batches).to_pandas().set_index("sample_time")
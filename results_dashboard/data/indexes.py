@@ -0,0 +1,165 @@
+import argparse
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from . import SensorData
+from .metadata import metadata_query
+from .mongo import mongo_tilt_db, tests_db
+from .rollup import SUMMARY_COLLECTION
+
+INDEXES = {
+    "sample": [
+        # every SensorData query matches on test_id (+ sensor_name)
+        IndexModel(
+            [
+                ("test_id", ASCENDING),
+                ("sensor_name", ASCENDING),
+                ("sample_time", ASCENDING),
+            ],
+            name="test_id_sensor_name_sample_time",
+        ),
+        # time-ordered scans: angle_data, exports, time windows
+        IndexModel(
+            [("test_id", ASCENDING), ("sample_time", ASCENDING)],
+            name="test_id_sample_time",
+        ),
+        # SampleStore watermark syncs
+        IndexModel([("test_id", ASCENDING), ("_id", ASCENDING)], name="test_id_id"),
+    ],
+    "test": [
+        # covers the test catalog's sorted, projected scans
+        IndexModel(
+            [
+                ("test_start_time", DESCENDING),
+                ("name", ASCENDING),
+                ("rows_written", ASCENDING),
+                ("status.steps_completed", ASCENDING),
+                ("status.total_steps", ASCENDING),
+                ("_id", ASCENDING),
+            ],
+            name="test_catalog",
+        ),
+    ],
+    SUMMARY_COLLECTION: [
+        IndexModel(
+            [("test_id", ASCENDING), ("sensor_name", ASCENDING)],
+            name="test_id_sensor_name",
+        ),
+    ],
+}
+
+
+def ensure_indexes() -> dict[str, list[str]]:
+    """Create any missing indexes. Existing ones are left untouched."""
+    db = mongo_tilt_db()
+    return {
+        collection: db[collection].create_indexes(models)
+        for collection, models in INDEXES.items()
+    }
+
+
+def report_queries(test_ids: list[str]) -> dict[str, dict]:
+    """Explainable commands for every query the dashboard runs on a selection."""
+    data = SensorData(test_ids)
+    match = data._match_query["$match"]
+
+    def pipeline(collection: str, query: list[dict]) -> dict:
+        return {"aggregate": collection, "pipeline": query, "cursor": {}}
+
+    return {
+        "SensorData._metadata": pipeline("sample", metadata_query(data._match_query)),
+        "SensorData.angle_data": pipeline("sample", data._angle_data_query),
+        "SensorData.temperature_data": pipeline(
+            "sample", data._temperature_query(data.temperature_bucket())
+        ),
+        "SensorData._angle_stats": pipeline("sample", data._angle_stats_query),
+        "SensorData._repeatability(dropped_rows=1)": pipeline(
+            "sample", data._repeatability_query(1)
+        ),
+        "SensorData.repeatability_residuals": pipeline(
+            "sample", data._residual_sample_query
+        ),
+        "rollup.summary_angle_stats": {
+            "find": SUMMARY_COLLECTION,
+            "filter": {"test_id": match["test_id"]},
+        },
+        "tests_db.get_tests": pipeline("test", tests_db._tests_query()),
+        "tests_db.get_catalog": {
+            "find": "test",
+            "filter": tests_db._catalog_query(),
+            "projection": tests_db.CATALOG_PROJECTION,
+            "sort": {"test_start_time": -1},
+        },
+        "tests_db.get_test_info": pipeline("test", tests_db._test_info_query(test_ids)),
+    }
+
+
+def _walk(node):
+    yield node
+    if isinstance(node, dict):
+        for value in node.values():
+            yield from _walk(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _walk(value)
+
+
+def summarize_explain(explain: dict) -> dict:
+    """Keys/docs examined vs returned and the plan stages from explain output."""
+    summary = {"keys_examined": 0, "docs_examined": 0, "returned": 0, "stages": set()}
+    for node in _walk(explain):
+        if not isinstance(node, dict):
+            continue
+        stats = node.get("executionStats")
+        if isinstance(stats, dict):
+            summary["keys_examined"] += stats.get("totalKeysExamined", 0)
+            summary["docs_examined"] += stats.get("totalDocsExamined", 0)
+            summary["returned"] += stats.get("nReturned", 0)
+        if isinstance(node.get("stage"), str):
+            summary["stages"].add(node["stage"])
+    summary["collection_scan"] = "COLLSCAN" in summary["stages"]
+    return summary
+
+
+def explain_report(test_ids: list[str]) -> list[tuple[str, dict]]:
+    db = mongo_tilt_db()
+    return [
+        (
+            name,
+            summarize_explain(
+                db.command("explain", command, verbosity="executionStats")
+            ),
+        )
+        for name, command in report_queries(test_ids).items()
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Create the dashboard's indexes or report how its queries run."
+    )
+    parser.add_argument(
+        "--report",
+        nargs="+",
+        metavar="TEST_ID",
+        help="Explain every dashboard query for these tests instead.",
+    )
+    args = parser.parse_args()
+
+    if not args.report:
+        for collection, names in ensure_indexes().items():
+            print(f"{collection}: {', '.join(names)}")
+        return
+
+    print(f"{'query':<45} {'keys':>12} {'docs':>12} {'returned':>12}  stages")
+    for name, summary in explain_report(args.report):
+        flag = "  <-- COLLSCAN" if summary["collection_scan"] else ""
+        print(
+            f"{name:<45} {summary['keys_examined']:>12,} "
+            f"{summary['docs_examined']:>12,} {summary['returned']:>12,}  "
+            f"{','.join(sorted(summary['stages']))}{flag}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""Running aggregates of selections with in-progress tests.
+
+A live tail fetches a selection's samples once, then on every refresh only
+the samples above each test's ``_id`` watermark, folding them into running
+counts, sums, sums of squares, minimums and maximums. The angle x sensor
+statistics and temperature buckets are derived from those sums, so a
+refresh costs the new samples rather than the whole test. As the test grows
+the temperature buckets are merged into wider ones.
+"""
+import threading
+import time
+from datetime import timedelta
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+
+from . import local, perf
+from .metadata import SelectionMetadata, build_metadata
+from .mongo import aggregate
+from .rollup import SUMMARY_FIELDS, stats_from_sums
+from .store import SAMPLE_COLUMNS, SAMPLE_PROJECTION
+
+# tails that haven't been used for this long are dropped
+IDLE_SECONDS = 600
+CHUNK_SIZE = 100_000
+
+
+def _sums(df: pd.DataFrame, by, columns: list[str]) -> pd.DataFrame:
+    """Count, sum, sum of squares, min and max of ``columns`` per group."""
+    squares = df[columns].pow(2).add_suffix("_sum_sq")
+    gb = pd.concat([df, squares], axis=1).groupby(by)
+    return pd.concat(
+        [
+            gb.size().rename("count"),
+            gb[columns].count().add_suffix("_count"),
+            gb[columns].sum().add_suffix("_sum"),
+            gb[list(squares)].sum(),
+            gb[columns].min().add_suffix("_min"),
+            gb[columns].max().add_suffix("_max"),
+        ],
+        axis=1,
+    )
+
+
+def _merge_sums(total: pd.DataFrame | None, new: pd.DataFrame) -> pd.DataFrame:
+    if total is None:
+        return new
+    total, new = total.align(new, join="outer")
+    merged = total.fillna(0) + new.fillna(0)
+    for column in merged.columns:
+        if column.endswith("_min"):
+            merged[column] = np.fmin(total[column], new[column])
+        elif column.endswith("_max"):
+            merged[column] = np.fmax(total[column], new[column])
+    return merged
+
+
+def _regroup(sums: pd.DataFrame, by) -> pd.DataFrame:
+    """Merge rows of ``_sums`` output into coarser groups."""
+    return sums.groupby(by).agg(
+        {
+            column: "min"
+            if column.endswith("_min")
+            else "max"
+            if column.endswith("_max")
+            else "sum"
+            for column in sums.columns
+        }
+    )
+
+
+class LiveTail:
+    """Running aggregates of one test and sensor selection."""
+
+    def __init__(
+        self, test_ids: list[str], sensor_mask: list[str] | None, bucket: timedelta
+    ):
+        self.test_ids = test_ids
+        self.sensor_mask = sensor_mask
+        self.bucket = bucket
+        # bumped whenever new samples are folded in
+        self.version = 0
+        self.last_used = time.monotonic()
+        self._watermarks: dict[str, ObjectId | None] = {t: None for t in test_ids}
+        self._angle_sums: pd.DataFrame | None = None
+        self._temperature_sums: pd.DataFrame | None = None
+        self._angle_rows: list[pd.DataFrame] = []
+        self._last_angle: float | None = None
+        self._test_counts: dict[str, int] = {}
+        self._times: list = []
+        # guards the running aggregates; refreshes also queue on their own lock
+        # so readers only wait while new samples are being folded in
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def _query(self) -> list[dict]:
+        tests = []
+        for test_id, watermark in self._watermarks.items():
+            test = {"test_id": ObjectId(test_id)}
+            if watermark is not None:
+                test["_id"] = {"$gt": watermark}
+            tests.append(test)
+        match = {"$or": tests}
+        if self.sensor_mask:
+            match["sensor_name"] = {"$in": list(self.sensor_mask)}
+        return [
+            {"$match": match},
+            {"$sort": {"_id": 1}},
+            {"$project": {**SAMPLE_PROJECTION, "test_id": 1}},
+        ]
+
+    def _fold(self, rows: list[dict]) -> None:
+        samples = pd.DataFrame(rows, columns=["_id", "test_id"] + SAMPLE_COLUMNS)
+        for test_id, last_id in samples.groupby("test_id")["_id"].max().items():
+            self._watermarks[str(test_id)] = last_id
+        for test_id, count in samples["test_id"].value_counts().items():
+            self._test_counts[str(test_id)] = (
+                self._test_counts.get(str(test_id), 0) + count
+            )
+        self._times += [samples["sample_time"].min(), samples["sample_time"].max()]
+
+        samples["angle"] = samples["set_angle"].round(6)
+        samples["error"] = samples["stage_angle"] - samples["degrees"]
+        self._angle_sums = _merge_sums(
+            self._angle_sums,
+            _sums(samples, ["angle", "sensor_name"], list(SUMMARY_FIELDS)),
+        )
+
+        buckets = samples["sample_time"].dt.floor(self.bucket).rename("sample_time")
+        self._temperature_sums = _merge_sums(
+            self._temperature_sums,
+            _sums(samples, buckets, list(local.TEMPERATURE_SOURCES)),
+        )
+
+        changes = local.angle_data(samples)
+        if len(changes) and changes["set_angle"].iloc[0] == self._last_angle:
+            changes = changes.iloc[1:]
+        self._angle_rows.append(changes)
+        self._last_angle = samples.sort_values("sample_time", kind="stable")[
+            "set_angle"
+        ].iloc[-1]
+
+    @perf.instrumented(name="LiveTail.refresh")
+    def refresh(self) -> int:
+        """Fold in samples written since the last refresh. Returns how many."""
+        with self._refresh_lock:
+            self.last_used = time.monotonic()
+            with self._lock:
+                query = self._query()
+            count = 0
+            rows = []
+            for row in aggregate("sample", query, allowDiskUse=True):
+                rows.append(row)
+                if len(rows) >= CHUNK_SIZE:
+                    with self._lock:
+                        self._fold(rows)
+                    count += len(rows)
+                    rows = []
+            with self._lock:
+                if rows:
+                    self._fold(rows)
+                    count += len(rows)
+                if count:
+                    self.version += 1
+            return count
+
+    def rebucket(self, bucket: timedelta) -> None:
+        """Merge the temperature buckets into ``bucket``, a multiple of the width."""
+        with self._lock:
+            if bucket == self.bucket:
+                return
+            if bucket % self.bucket:
+                raise ValueError(f"{bucket} is not a multiple of {self.bucket}")
+            if self._temperature_sums is not None:
+                sums = self._temperature_sums
+                self._temperature_sums = _regroup(sums, sums.index.floor(bucket))
+            self.bucket = bucket
+            self.version += 1
+
+    def angle_stats(self) -> pd.DataFrame:
+        with self._lock:
+            if self._angle_sums is None:
+                return pd.DataFrame()
+            return stats_from_sums(self._angle_sums)
+
+    def metadata(self) -> SelectionMetadata:
+        with self._lock:
+            index = (
+                self._angle_sums.index
+                if self._angle_sums is not None
+                else pd.MultiIndex.from_tuples([], names=["angle", "sensor_name"])
+            )
+            return build_metadata(
+                index.get_level_values("sensor_name"),
+                index.get_level_values("angle"),
+                dict(self._test_counts),
+                [min(self._times).to_pydatetime()] if self._times else [],
+                [max(self._times).to_pydatetime()] if self._times else [],
+            )
+
+    def angle_data(self) -> pd.DataFrame:
+        with self._lock:
+            if not self._angle_rows:
+                return pd.DataFrame(columns=["sample_time", "set_angle", "stage_angle"])
+            return pd.concat(self._angle_rows, ignore_index=True)
+
+    def temperature_data(self) -> pd.DataFrame:
+        """Same columns as ``SensorData.temperature_data``."""
+        with self._lock:
+            sums = self._temperature_sums
+        if sums is None:
+            return pd.DataFrame(
+                columns=["sample_time", "source", "mean", "max", "min", "dev"]
+            )
+        frames = []
+        for column, source in local.TEMPERATURE_SOURCES.items():
+            n = sums[f"{column}_count"]
+            total = sums[f"{column}_sum"]
+            variance = (sums[f"{column}_sum_sq"] - total**2 / n) / (n - 1).where(
+                n > 1
+            )
+            df = pd.DataFrame(
+                {
+                    "mean": total / n.where(n > 0),
+                    "max": sums[f"{column}_max"],
+                    "min": sums[f"{column}_min"],
+                    "dev": np.sqrt(variance.clip(lower=0)),
+                }
+            ).reset_index()
+            df.insert(1, "source", source)
+            frames.append(df)
+        return (
+            pd.concat(frames, ignore_index=True)
+            .sort_values("sample_time", kind="stable")
+            .reset_index(drop=True)
+        )
+
+
+_tails: dict[tuple, LiveTail] = {}
+_tails_lock = threading.Lock()
+
+
+def live_tail(
+    test_ids: list[str],
+    sensor_mask: list[str] | None,
+    bucket: Callable[[], timedelta],
+) -> LiveTail:
+    """The selection's live tail, created on first use with ``bucket()`` wide
+    temperature buckets."""
+    key = (
+        tuple(sorted(str(test_id) for test_id in test_ids)),
+        tuple(sorted(sensor_mask)) if sensor_mask else None,
+    )
+    now = time.monotonic()
+    with _tails_lock:
+        for idle in [k for k, t in _tails.items() if now - t.last_used > IDLE_SECONDS]:
+            del _tails[idle]
+        if key not in _tails:
+            _tails[key] = LiveTail(list(key[0]), sensor_mask, bucket())
+        tail = _tails[key]
+        tail.last_used = now
+        return tail
@@ -0,0 +1,88 @@
+"""SensorData aggregations computed with pandas on locally stored samples."""
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+TEMPERATURE_SOURCES = {
+    "oven_integrated_temperature": "integrated",
+    "oven_set_temperature": "setpoint",
+    "thermocouple_temperature": "thermocouple",
+    "ambient_temperature": "ambient",
+}
+
+
+def angle_stats(samples: pd.DataFrame) -> pd.DataFrame:
+    samples = samples.assign(
+        angle=samples["set_angle"].round(6),
+        error=samples["stage_angle"] - samples["degrees"],
+    )
+    gb = samples.groupby(["angle", "sensor_name"], observed=True)
+    df = pd.concat(
+        [
+            gb.size().rename("count"),
+            gb["raw"].agg(["max", "min", "mean", "std"]).add_suffix("_raw"),
+            gb["degrees"].agg(["max", "min", "mean"]).add_suffix("_degrees"),
+            gb["error"].agg(["max", "min", "mean", "std"]).add_suffix("_error"),
+        ],
+        axis=1,
+    )
+    df.columns = [column.replace("std_", "dev_") for column in df.columns]
+    return df.reset_index()
+
+
+def repeatability(samples: pd.DataFrame, dropped_rows: int) -> pd.DataFrame:
+    samples = samples.iloc[dropped_rows:]
+    df = (
+        samples.assign(angle=samples["set_angle"].round(6))
+        .groupby(["angle", "sensor_name"], observed=True)["degrees"]
+        .agg(max_degrees="max", min_degrees="min")
+        .reset_index()
+    )
+    df["range"] = df["max_degrees"] - df["min_degrees"]
+    df["repeatability"] = df["range"] / 2
+    return df
+
+
+def repeatability_residuals(samples: pd.DataFrame) -> pd.DataFrame:
+    df = pd.DataFrame(
+        {
+            "sample_time": samples["sample_time"],
+            "sensor_name": samples["sensor_name"],
+            "set_angle": samples["set_angle"].round(6),
+            "sensor_degrees": samples["degrees"],
+        }
+    )
+    means = df.groupby(["set_angle", "sensor_name"], observed=True)[
+        "sensor_degrees"
+    ].transform("mean")
+    df["residual"] = df["sensor_degrees"] - means
+    return df.reset_index(drop=True)
+
+
+def angle_data(samples: pd.DataFrame) -> pd.DataFrame:
+    df = (
+        samples[["sample_time", "set_angle", "stage_angle"]]
+        .sort_values("sample_time", kind="stable")
+        .drop_duplicates("sample_time")
+    )
+    changed = df["set_angle"].to_numpy() != np.roll(df["set_angle"].to_numpy(), 1)
+    if len(changed):
+        changed[0] = True
+    return df.loc[changed].reset_index(drop=True)
+
+
+def temperature_data(samples: pd.DataFrame, bucket: timedelta) -> pd.DataFrame:
+    buckets = samples["sample_time"].dt.floor(bucket).rename("sample_time")
+    frames = []
+    for column, source in TEMPERATURE_SOURCES.items():
+        df = (
+            samples[column]
+            .groupby(buckets)
+            .agg(["mean", "max", "min", "std"])
+            .rename(columns={"std": "dev"})
+            .reset_index()
+        )
+        df.insert(1, "source", source)
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,79 @@
+from datetime import datetime
+from typing import NamedTuple
+
+import pandas as pd
+
+
+class SelectionMetadata(NamedTuple):
+    """What a selection contains, gathered in one pass."""
+
+    count: int
+    sensor_names: list[str]
+    set_angles: list[float]
+    time_range: tuple[datetime, datetime] | None
+    test_counts: dict[str, int]
+
+
+def metadata_query(match: dict) -> list[dict]:
+    return [
+        match,
+        {
+            "$facet": {
+                "sensors": [{"$group": {"_id": "$sensor_name"}}],
+                "angles": [
+                    {"$group": {"_id": {"$round": ["$stage_data.set_angle", 6]}}}
+                ],
+                "tests": [
+                    {
+                        "$group": {
+                            "_id": "$test_id",
+                            "count": {"$sum": 1},
+                            "start": {"$min": "$sample_time"},
+                            "end": {"$max": "$sample_time"},
+                        }
+                    }
+                ],
+            }
+        },
+    ]
+
+
+def build_metadata(
+    sensors, angles, test_counts: dict[str, int], starts: list, ends: list
+) -> SelectionMetadata:
+    starts = [start for start in starts if start is not None and not pd.isna(start)]
+    ends = [end for end in ends if end is not None and not pd.isna(end)]
+    return SelectionMetadata(
+        count=sum(test_counts.values()),
+        sensor_names=sorted({s for s in sensors if isinstance(s, str)}),
+        set_angles=sorted(
+            {float(a) for a in angles if a is not None and not pd.isna(a)}
+        ),
+        time_range=(min(starts), max(ends)) if starts else None,
+        test_counts=test_counts,
+    )
+
+
+def from_facet(result: dict) -> SelectionMetadata:
+    """Metadata from the single document ``metadata_query`` returns."""
+    tests = result["tests"]
+    return build_metadata(
+        [doc["_id"] for doc in result["sensors"]],
+        [doc["_id"] for doc in result["angles"]],
+        {str(doc["_id"]): doc["count"] for doc in tests if doc["count"]},
+        [doc["start"] for doc in tests],
+        [doc["end"] for doc in tests],
+    )
+
+
+def from_frames(frames: dict[str, pd.DataFrame]) -> SelectionMetadata:
+    """Metadata from each test's samples, with sensor_name, set_angle and
+    sample_time columns."""
+    frames = {test_id: df for test_id, df in frames.items() if len(df)}
+    return build_metadata(
+        [s for df in frames.values() for s in df["sensor_name"].unique()],
+        [a for df in frames.values() for a in df["set_angle"].round(6).unique()],
+        {test_id: len(df) for test_id, df in frames.items()},
+        [df["sample_time"].min().to_pydatetime() for df in frames.values()],
+        [df["sample_time"].max().to_pydatetime() for df in frames.values()],
+    )
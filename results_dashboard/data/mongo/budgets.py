@@ -0,0 +1,184 @@
+"""Time and memory budgets for queries, and cancelling queries nobody needs.
+
+Aggregations run inside ``budget`` (every cached ``SensorData`` method) get
+``maxTimeMS`` and ``allowDiskUse`` from the budget of the method running
+them, looked up by the names shown in the Performance panel, innermost
+first, e.g. in secrets.toml::
+
+    [query_budgets."SensorData.repeatability_residuals"]
+    max_time_ms = 120000
+    allow_disk_use = false
+    timeout = 180
+
+``max_time_ms`` makes the server abort a command that runs longer, and
+without ``allow_disk_use`` stages fail rather than spill past the server's
+100 MB memory limit. Aggregations outside any ``budget`` scope, such as the
+rollup job and exports, only get a budget configured for a span they run in.
+Inside ``budget``, cursors read through ``cancellable`` are also closed once
+``timeout`` seconds have passed or once every caller waiting for the query
+has gone, e.g. after a rerun superseded the page.
+Running past a budget raises ``QueryBudgetExceeded``.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator
+
+import streamlit as st
+from pymongo.errors import ExecutionTimeout, OperationFailure
+
+from .. import perf
+
+QUERY_MAX_TIME_MS = int(st.secrets.get("query_max_time_ms", 60_000))
+QUERY_ALLOW_DISK_USE = bool(st.secrets.get("query_allow_disk_use", True))
+QUERY_TIMEOUT = float(st.secrets.get("query_timeout", 120))
+
+# budgets that hold unless secrets.toml sets others; 0 means no limit
+DEFAULT_BUDGETS = {
+    # copy whole tests once, and only as fast as the network allows
+    "SampleStore.sync": {"max_time_ms": 0, "timeout": 0},
+    "LiveTail.refresh": {"max_time_ms": 0, "timeout": 0},
+}
+QUERY_BUDGETS = {
+    **DEFAULT_BUDGETS,
+    **{
+        name: dict(budget)
+        for name, budget in st.secrets.get("query_budgets", {}).items()
+    },
+}
+
+# ExceededMemoryLimit and QueryExceededMemoryLimitNoDiskUseAllowed
+MEMORY_LIMIT_CODES = {146, 292}
+
+
+class QueryBudgetExceeded(Exception):
+    """A query ran past its time or memory budget."""
+
+
+class QueryCancelled(Exception):
+    """A query was stopped because no caller waits for its result any more."""
+
+
+@dataclass(frozen=True)
+class Budget:
+    name: str
+    max_time_ms: int
+    allow_disk_use: bool
+    timeout: float
+
+    def describe(self) -> str:
+        limits = []
+        if self.max_time_ms:
+            limits.append(f"{self.max_time_ms / 1000:g} s on the server")
+        if self.timeout:
+            limits.append(f"{self.timeout:g} s in total")
+        if not self.allow_disk_use:
+            limits.append("no disk use")
+        return ", ".join(limits) or "no limits"
+
+
+@dataclass(frozen=True)
+class _Scope:
+    budget: Budget
+    deadline: float | None
+    cancelled: Callable[[], bool] | None
+
+
+_scope: ContextVar[_Scope | None] = ContextVar("query_budget", default=None)
+
+
+def budget_for(name: str | None) -> Budget:
+    """The budget configured for a method, else the default."""
+    config = QUERY_BUDGETS.get(name, {})
+    return Budget(
+        name or "",
+        int(config.get("max_time_ms", QUERY_MAX_TIME_MS)),
+        bool(config.get("allow_disk_use", QUERY_ALLOW_DISK_USE)),
+        float(config.get("timeout", QUERY_TIMEOUT)),
+    )
+
+
+def current_budget() -> Budget | None:
+    """The budget of the innermost configured span, else of the budget scope.
+
+    None outside both, where queries run without limits.
+    """
+    span = perf.current_span()
+    while span is not None:
+        if span.name in QUERY_BUDGETS:
+            return budget_for(span.name)
+        span = span.parent
+    scope = _scope.get()
+    return scope.budget if scope is not None else None
+
+
+def query_options() -> dict:
+    """``maxTimeMS`` and ``allowDiskUse`` for an aggregation run now."""
+    budget = current_budget()
+    if budget is None:
+        return {}
+    options = {"allowDiskUse": budget.allow_disk_use}
+    if budget.max_time_ms:
+        options["maxTimeMS"] = budget.max_time_ms
+    return options
+
+
+@contextmanager
+def budget(name: str, cancelled: Callable[[], bool] | None = None):
+    """Run queries on ``name``'s budget, stopping them once ``cancelled()``.
+
+    Nested scopes keep their parent's ``cancelled``. Server timeouts and memory
+    limit failures inside the scope are raised as ``QueryBudgetExceeded``.
+    """
+    parent = _scope.get()
+    limits = budget_for(name)
+    scope = _Scope(
+        limits,
+        time.monotonic() + limits.timeout if limits.timeout else None,
+        cancelled or (parent.cancelled if parent is not None else None),
+    )
+    token = _scope.set(scope)
+    try:
+        yield limits
+    except ExecutionTimeout as e:
+        raise QueryBudgetExceeded(f"{name} ran past {limits.describe()}") from e
+    except OperationFailure as e:
+        if e.code not in MEMORY_LIMIT_CODES:
+            raise
+        raise QueryBudgetExceeded(
+            f"{name} needed more memory than the server allows without disk use"
+        ) from e
+    finally:
+        _scope.reset(token)
+
+
+def cancelled() -> bool:
+    """Whether every caller waiting for the current query has gone."""
+    scope = _scope.get()
+    return scope is not None and scope.cancelled is not None and scope.cancelled()
+
+
+def check() -> None:
+    """Raise if the current query was cancelled or is past its timeout."""
+    scope = _scope.get()
+    if scope is None:
+        return
+    if scope.cancelled is not None and scope.cancelled():
+        raise QueryCancelled(scope.budget.name)
+    if scope.deadline is not None and time.monotonic() > scope.deadline:
+        raise QueryBudgetExceeded(
+            f"{scope.budget.name} ran past {scope.budget.describe()}"
+        )
+
+
+def cancellable(cursor: Iterable) -> Iterator:
+    """Iterate a cursor, closing it on the server when ``check`` raises."""
+    try:
+        for item in cursor:
+            check()
+            yield item
+    finally:
+        close = getattr(cursor, "close", None)
+        if close is not None:
+            close()
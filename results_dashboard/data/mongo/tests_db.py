@@ -2,11 +2,24 @@ import pandas as pd
 import streamlit as st
 from bson import ObjectId
 
-from . import mongo_tilt_db
+from ..perf import instrumented
+from . import aggregate, mongo_tilt_db
 
 
-def get_tests(series=None, object_ids=None):
-    db = mongo_tilt_db()
+def _object_ids(test_ids):
+    if isinstance(test_ids, str) or isinstance(test_ids, ObjectId):
+        test_ids = [test_ids]
+
+    search_ids = []
+    for test_id in test_ids:
+        if isinstance(test_id, str):
+            search_ids.append(ObjectId(test_id))
+        else:
+            search_ids.append(test_id)
+    return search_ids
+
+
+def _tests_query(object_ids=None):
     aggregate_query = [
         {"$sort": {"test_start_time": -1}},
         {
@@ -31,39 +44,99 @@ def get_tests(series=None, object_ids=None):
         },
     ]
     if object_ids is not None:
-        search_ids = []
-        for test_id in object_ids:
-            if isinstance(test_id, str):
-                search_ids.append(ObjectId(test_id))
-            else:
-                search_ids.append(test_id)
+        search_ids = _object_ids(object_ids)
         aggregate_query.insert(0, {"$match": {"_id": {"$in": search_ids}}})
-    test_df = pd.DataFrame(list(db["test"].aggregate(aggregate_query)))
+    return aggregate_query
+
+
+@instrumented()
+def get_tests(series=None, object_ids=None):
+    test_df = pd.DataFrame(list(aggregate("test", _tests_query(object_ids))))
     test_df["_id"] = test_df["_id"].astype(str)
     return test_df
 
 
+# fields the test catalog reads, all held by the test_catalog index
+CATALOG_PROJECTION = {
+    "_id": 1,
+    "name": 1,
+    "test_start_time": 1,
+    "rows_written": 1,
+    "status.steps_completed": 1,
+    "status.total_steps": 1,
+}
+
+
+def _catalog_query(since=None, object_ids=None) -> dict:
+    """Tests started at or after ``since``, or with the given ids."""
+    clauses = []
+    if since is not None:
+        clauses.append({"test_start_time": {"$gte": since}})
+    if object_ids:
+        clauses.append({"_id": {"$in": _object_ids(object_ids)}})
+    if not clauses:
+        return {}
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+@instrumented()
+def get_catalog(since=None, object_ids=None) -> pd.DataFrame:
+    """Catalog rows, newest first: id, label, progress, rows written, start."""
+    cursor = (
+        mongo_tilt_db()["test"]
+        .find(_catalog_query(since, object_ids), CATALOG_PROJECTION)
+        .sort("test_start_time", -1)
+    )
+    rows = []
+    for test in cursor:
+        start = test.get("test_start_time")
+        status = test.get("status", {})
+        completed = status.get("steps_completed")
+        total = status.get("total_steps")
+        rows.append(
+            {
+                "_id": str(test["_id"]),
+                # same label get_tests builds server-side
+                "label": f"{test['name']}-{start:%m/%d/%Y-%H:%M:%S}"
+                if test.get("name") is not None and start is not None
+                else None,
+                "progress": completed / total
+                if completed is not None and total
+                else None,
+                "rows_written": test.get("rows_written"),
+                "test_start_time": start,
+            }
+        )
+    df = pd.DataFrame(
+        rows, columns=["_id", "label", "progress", "rows_written", "test_start_time"]
+    )
+    df["progress"] = pd.to_numeric(df["progress"])
+    df["rows_written"] = pd.to_numeric(df["rows_written"]).fillna(0).astype(int)
+    return df
+
+
+def is_complete(test: dict) -> bool:
+    """Whether a test document's status shows every step completed."""
+    status = test.get("status", {})
+    return status.get("total_steps") is not None and status.get(
+        "steps_completed"
+    ) == status.get("total_steps")
+
+
+@instrumented()
 def update_test_info(test_id, new_info):
     db = mongo_tilt_db()
     db["test"].update_one({"_id": test_id}, {"$set": {"test_info": new_info}})
 
 
-def get_test_info(test_ids):
-    db = mongo_tilt_db()
-
-    if isinstance(test_ids, str) or isinstance(test_ids, ObjectId):
-        test_ids = [test_ids]
+def _test_info_query(test_ids):
+    search_ids = _object_ids(test_ids)
+    return [{"$match": {"_id": {"$in": search_ids}}}, {"$unset": "test_info.steps"}]
 
-    search_ids = []
-    for test_id in test_ids:
-        if isinstance(test_id, str):
-            search_ids.append(ObjectId(test_id))
-        else:
-            search_ids.append(test_id)
 
-    cursor = db["test"].aggregate(
-        [{"$match": {"_id": {"$in": search_ids}}}, {"$unset": "test_info.steps"}]
-    )
+@instrumented()
+def get_test_info(test_ids):
+    cursor = aggregate("test", _test_info_query(test_ids))
     results = list(cursor)
 
     return results
@@ -0,0 +1,210 @@
+"""Where a page rerun's time goes.
+
+Queries, ``SensorData`` methods and page sections are recorded as spans on
+the current rerun. A span's ``mongo_seconds``, ``round_trips`` and ``docs``
+come from a pymongo command listener, so the rest of its time is decoding
+and pandas work. Spans nest: a parent's Mongo time includes its children's.
+
+The rerun is tracked in a context variable, which the query threads running
+``SensorData`` methods inherit. Every finished span is also
+logged as a JSON line for the server logs.
+"""
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields
+from typing import Callable
+
+import pandas as pd
+import streamlit as st
+from pymongo import monitoring
+
+PERF_LOG = bool(st.secrets.get("perf_log", True))
+# spans quicker than this are kept for the panel but not logged
+PERF_LOG_MIN_SECONDS = float(st.secrets.get("perf_log_min_seconds", 0.1))
+
+logger = logging.getLogger(__name__)
+
+# Streamlit only sets up its own loggers, so give the dashboard's somewhere to go
+_package_logger = logging.getLogger(__name__.split(".")[0])
+if not _package_logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+    _package_logger.addHandler(_handler)
+    _package_logger.setLevel(st.secrets.get("log_level", "INFO"))
+
+
+@dataclass
+class Span:
+    kind: str
+    name: str
+    depth: int = 0
+    seconds: float = 0.0
+    mongo_seconds: float = 0.0
+    round_trips: int = 0
+    docs: int = 0
+    bytes: int | None = None
+    rows: int | None = None
+    cache: str | None = None
+    # seconds since a cached result was computed
+    age: float | None = None
+    # shown on the page, e.g. when a fallback replaced a result
+    notice: str | None = None
+    parent: "Span | None" = field(default=None, repr=False)
+
+
+@dataclass
+class Run:
+    page: str
+    # the page's script thread, where Streamlit can interrupt a rerun
+    thread: int = field(default_factory=threading.get_ident)
+    started: float = field(default_factory=time.perf_counter)
+    last_checkpoint: float = field(default_factory=time.perf_counter)
+    spans: list[Span] = field(default_factory=list)
+
+
+_run: contextvars.ContextVar[Run | None] = contextvars.ContextVar(
+    "perf_run", default=None
+)
+_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "perf_span", default=None
+)
+
+
+def start_run(page: str = "") -> Run:
+    """Start recording a rerun of ``page``. Call once at the top of a page."""
+    run = Run(page)
+    _run.set(run)
+    _span.set(None)
+    return run
+
+
+def current_run() -> Run | None:
+    return _run.get()
+
+
+def current_span() -> Span | None:
+    return _span.get()
+
+
+def on_page_thread() -> bool:
+    """Whether this thread is running the current page, not a query worker."""
+    run = _run.get()
+    return run is not None and run.thread == threading.get_ident()
+
+
+def rows_of(value) -> int | None:
+    """Length of a frame or collection result, None for anything else."""
+    if isinstance(value, (pd.DataFrame, pd.Series, list, dict)):
+        return len(value)
+    return None
+
+
+def _log(span: Span) -> None:
+    if not PERF_LOG or span.seconds < PERF_LOG_MIN_SECONDS:
+        return
+    run = _run.get()
+    record = {
+        f.name: getattr(span, f.name)
+        for f in fields(span)
+        if f.name != "parent" and getattr(span, f.name) is not None
+    }
+    logger.info(json.dumps({"perf": record, "page": run.page if run else None}))
+
+
+@contextmanager
+def span(kind: str, name: str):
+    """Time a block as a span of the current rerun and yield it."""
+    parent = _span.get()
+    current = Span(kind, name, depth=parent.depth + 1 if parent else 0)
+    current.parent = parent
+    run = _run.get()
+    if run is not None:
+        run.spans.append(current)
+    token = _span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - start
+        _span.reset(token)
+        if parent is not None:
+            parent.mongo_seconds += current.mongo_seconds
+            parent.round_trips += current.round_trips
+            parent.docs += current.docs
+        _log(current)
+
+
+def instrumented(kind: str = "query", name: str | None = None) -> Callable:
+    """Record every call of a function as a span."""
+
+    def decorator(func: Callable) -> Callable:
+        label = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(kind, label) as s:
+                result = func(*args, **kwargs)
+                s.rows = rows_of(result)
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def checkpoint(name: str) -> None:
+    """Record the page time since the previous checkpoint as section ``name``.
+
+    Called at the end of each page section, so charts don't need to be
+    re-indented under a ``with`` block.
+    """
+    run = _run.get()
+    if run is None:
+        return
+    now = time.perf_counter()
+    section = Span("section", name, seconds=now - run.last_checkpoint)
+    run.last_checkpoint = now
+    run.spans.append(section)
+    _log(section)
+
+
+def bound(func: Callable) -> Callable:
+    """``func`` bound to the caller's context, for running on another thread."""
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+class QueryMonitor(monitoring.CommandListener):
+    """Add each command's server round trip to the span that issued it."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        current = _span.get()
+        if current is None:
+            return
+        current.mongo_seconds += event.duration_micros / 1e6
+        current.round_trips += 1
+        reply = event.reply if isinstance(event.reply, dict) else {}
+        cursor = reply.get("cursor", {})
+        batch = cursor.get("firstBatch", cursor.get("nextBatch"))
+        # raw batch cursors report undecoded bytes; aggregate_frame counts
+        # their rows once decoded
+        if isinstance(batch, list) and not (batch and isinstance(batch[0], bytes)):
+            current.docs += len(batch)
+
+    def failed(self, event):
+        current = _span.get()
+        if current is not None:
+            current.mongo_seconds += event.duration_micros / 1e6
+            current.round_trips += 1
+
+
+query_monitor = QueryMonitor()
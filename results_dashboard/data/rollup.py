@@ -0,0 +1,291 @@
+import argparse
+import datetime
+import time
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+
+from . import perf
+from .mongo import aggregate, mongo_tilt_db
+
+SUMMARY_COLLECTION = "sample_summary"
+# per test: the last sample _id rolled up and the rows_written seen then
+SUMMARY_STATE_COLLECTION = "sample_summary_state"
+# bumped when summary documents change, so every test is rolled up again
+SUMMARY_VERSION = 2
+
+# sample fields rolled up for every (test, angle, sensor)
+SUMMARY_FIELDS = {
+    "raw": "$sensor_data.raw",
+    "degrees": "$sensor_data.degrees",
+    "error": {
+        "$sum": [
+            "$stage_data.stage_angle",
+            {"$multiply": [-1, "$sensor_data.degrees"]},
+        ]
+    },
+}
+SUMMARY_STATS = ("count", "sum", "sum_sq", "min", "max")
+
+
+def _rollup_query(match: dict, when_matched) -> list[dict]:
+    accumulators = {"count": {"$sum": 1}}
+    for name, expression in SUMMARY_FIELDS.items():
+        # like $avg and $stdDevSamp, only numeric values count
+        accumulators[f"{name}_count"] = {
+            "$sum": {"$cond": [{"$isNumber": expression}, 1, 0]}
+        }
+        accumulators[f"{name}_sum"] = {"$sum": expression}
+        accumulators[f"{name}_sum_sq"] = {
+            "$sum": {"$multiply": [expression, expression]}
+        }
+        accumulators[f"{name}_min"] = {"$min": expression}
+        accumulators[f"{name}_max"] = {"$max": expression}
+
+    return [
+        {"$match": match},
+        {
+            "$group": {
+                "_id": {
+                    "test_id": "$test_id",
+                    "angle": {"$round": ["$stage_data.set_angle", 6]},
+                    "sensor_name": "$sensor_name",
+                },
+                **accumulators,
+            }
+        },
+        {
+            "$project": {
+                "test_id": "$_id.test_id",
+                "angle": "$_id.angle",
+                "sensor_name": "$_id.sensor_name",
+                "count": 1,
+                **{
+                    name: {stat: f"${name}_{stat}" for stat in SUMMARY_STATS}
+                    for name in SUMMARY_FIELDS
+                },
+                "rollup_time": "$$NOW",
+            }
+        },
+        {
+            "$merge": {
+                "into": SUMMARY_COLLECTION,
+                "on": "_id",
+                "whenMatched": when_matched,
+                "whenNotMatched": "insert",
+            }
+        },
+    ]
+
+
+def _add_to_summary() -> list[dict]:
+    """``$merge`` pipeline adding new samples' sums to a summary document."""
+
+    def combined(name: str, stat: str) -> dict:
+        operator = {"min": "$min", "max": "$max"}.get(stat, "$add")
+        return {operator: [f"${name}.{stat}", f"$$new.{name}.{stat}"]}
+
+    return [
+        {
+            "$set": {
+                "count": {"$add": ["$count", "$$new.count"]},
+                **{
+                    name: {stat: combined(name, stat) for stat in SUMMARY_STATS}
+                    for name in SUMMARY_FIELDS
+                },
+                "rollup_time": "$$new.rollup_time",
+            }
+        }
+    ]
+
+
+def rollup_test(test_id: str | ObjectId, full: bool = False) -> int:
+    """Roll a test's new samples into its summaries. Returns the rows_written seen.
+
+    Only samples past the last rolled up ``_id`` are aggregated and added to
+    the stored sums, so a running test costs its new samples. The summaries
+    are rebuilt instead with ``full``, after a SUMMARY_VERSION change, or if
+    the previous roll-up was interrupted.
+    """
+    db = mongo_tilt_db()
+    states = db[SUMMARY_STATE_COLLECTION]
+    test_id = ObjectId(test_id)
+    state = states.find_one({"_id": test_id}) or {}
+    full = (
+        full
+        or state.get("version") != SUMMARY_VERSION
+        or state.get("watermark") is None
+        or "rolling_up_to" in state
+    )
+    # snapshot before aggregating so a summary never claims rows it may lack
+    test = db["test"].find_one({"_id": test_id}, {"rows_written": 1})
+    rows_written = (test or {}).get("rows_written", 0)
+    last = db["sample"].find_one({"test_id": test_id}, {"_id": 1}, sort=[("_id", -1)])
+    watermark = last["_id"] if last is not None else None
+
+    if full or watermark != state["watermark"]:
+        # cleared once the summaries hold every sample up to the watermark
+        states.update_one(
+            {"_id": test_id}, {"$set": {"rolling_up_to": watermark}}, upsert=True
+        )
+        if full:
+            db[SUMMARY_COLLECTION].delete_many({"test_id": test_id})
+        if watermark is not None:
+            # ObjectIds from the test's single writer increase with insertion
+            ids = {"$lte": watermark}
+            if not full:
+                ids["$gt"] = state["watermark"]
+            list(
+                aggregate(
+                    "sample",
+                    _rollup_query(
+                        {"test_id": test_id, "_id": ids},
+                        "replace" if full else _add_to_summary(),
+                    ),
+                    allowDiskUse=True,
+                )
+            )
+    states.replace_one(
+        {"_id": test_id},
+        {
+            "watermark": watermark,
+            "rows_written": rows_written,
+            "version": SUMMARY_VERSION,
+        },
+        upsert=True,
+    )
+    return rows_written
+
+
+def stale_tests() -> list[ObjectId]:
+    """Tests with samples whose summary is missing or older than rows_written."""
+    db = mongo_tilt_db()
+    rolled_up = {
+        state["_id"]: state["rows_written"]
+        for state in db[SUMMARY_STATE_COLLECTION].find(
+            {"version": SUMMARY_VERSION, "rolling_up_to": {"$exists": False}},
+            {"rows_written": 1},
+        )
+    }
+    return [
+        test["_id"]
+        for test in db["test"].find({"rows_written": {"$gt": 0}}, {"rows_written": 1})
+        if rolled_up.get(test["_id"]) != test["rows_written"]
+    ]
+
+
+@perf.instrumented()
+def summary_angle_stats(
+    test_ids: list[str], sensor_mask: list[str] | None = None, partial: bool = False
+) -> pd.DataFrame | None:
+    """Angle x sensor statistics from up-to-date summaries, else None.
+
+    Matches the columns of ``SensorData._angle_stats``. With ``partial``
+    summaries missing the latest samples of running tests are used too.
+    """
+    db = mongo_tilt_db()
+    object_ids = [ObjectId(test_id) for test_id in test_ids]
+
+    rows_written = {
+        test["_id"]: test.get("rows_written", 0)
+        for test in db["test"].find({"_id": {"$in": object_ids}}, {"rows_written": 1})
+    }
+    states = {
+        state["_id"]: state
+        for state in db[SUMMARY_STATE_COLLECTION].find({"_id": {"$in": object_ids}})
+    }
+    for test_id in object_ids:
+        state = states.get(test_id)
+        if (
+            state is None
+            or state.get("version") != SUMMARY_VERSION
+            or "rolling_up_to" in state
+        ):
+            return None
+        if not partial and state["rows_written"] != rows_written.get(test_id):
+            return None
+
+    match = {"test_id": {"$in": object_ids}}
+    if sensor_mask:
+        match["sensor_name"] = {"$in": list(sensor_mask)}
+    docs = list(db[SUMMARY_COLLECTION].find(match))
+    if not docs:
+        return None
+
+    df = pd.json_normalize(docs, sep="_")
+    gb = df.groupby(["angle", "sensor_name"])
+    sums = gb[
+        ["count"]
+        + [
+            f"{name}_{stat}"
+            for name in SUMMARY_FIELDS
+            for stat in ("count", "sum", "sum_sq")
+        ]
+    ].sum()
+    mins = gb[[f"{name}_min" for name in SUMMARY_FIELDS]].min()
+    maxs = gb[[f"{name}_max" for name in SUMMARY_FIELDS]].max()
+    return stats_from_sums(pd.concat([sums, mins, maxs], axis=1))
+
+
+def stats_from_sums(sums: pd.DataFrame) -> pd.DataFrame:
+    """``SensorData._angle_stats`` columns from per angle and sensor sums.
+
+    ``sums`` is indexed by angle and sensor_name with a ``count`` column of
+    samples and ``<field>_count``, ``_sum``, ``_sum_sq``, ``_min`` and ``_max``
+    for each SUMMARY_FIELDS, counting only the samples where it is set.
+    """
+    stats = pd.DataFrame({"count": sums["count"]})
+    for name in SUMMARY_FIELDS:
+        n = sums[f"{name}_count"]
+        stats[f"max_{name}"] = sums[f"{name}_max"]
+        stats[f"min_{name}"] = sums[f"{name}_min"]
+        stats[f"mean_{name}"] = sums[f"{name}_sum"] / n.where(n > 0)
+        # sample variance, undefined for a single sample as with $stdDevSamp
+        variance = (sums[f"{name}_sum_sq"] - sums[f"{name}_sum"] ** 2 / n) / (
+            n - 1
+        ).where(n > 1)
+        stats[f"dev_{name}"] = np.sqrt(variance.clip(lower=0))
+
+    stats = stats.drop(columns="dev_degrees")
+    return stats.reset_index()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Roll samples up into per test/angle/sensor summaries."
+    )
+    parser.add_argument(
+        "--test-id",
+        action="append",
+        dest="test_ids",
+        help="Test to roll up (repeatable). Defaults to every stale test.",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Rebuild the summaries rather than adding the new samples.",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=0,
+        help="Keep running, checking for stale tests every INTERVAL seconds.",
+    )
+    args = parser.parse_args()
+
+    while True:
+        for test_id in args.test_ids or stale_tests():
+            start = time.perf_counter()
+            rows_written = rollup_test(test_id, full=args.full)
+            print(
+                f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S} rolled up {test_id} "
+                f"({rows_written:,} rows) in {time.perf_counter() - start:.1f} s"
+            )
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
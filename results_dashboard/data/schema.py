@@ -0,0 +1,66 @@
+"""Compact dtypes for the frames SensorData returns.
+
+Sensor, series and temperature source names become categoricals, times
+datetime64 and measurements float32. float32 resolves 8e-6 at 90 degrees,
+0.004 counts at mid-scale and 0.0002 degC at 1000 degC, all finer than the
+stage encoder, the 16-bit ADC and the thermocouples. Set angles and zeroes
+stay float64: they are join keys rounded to 6 places and compared against
+``SensorData.set_angles``, which float32 can't represent exactly.
+"""
+import functools
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+COMPACT_FRAMES = bool(st.secrets.get("compact_frames", True))
+
+CATEGORY_COLUMNS = {"sensor_name", "series", "source"}
+FLOAT64_COLUMNS = {"angle", "set_angle", "zero"}
+TIME_COLUMNS = {"sample_time"}
+
+
+def _compact_column(name, values: pd.Series) -> pd.Series:
+    if name in CATEGORY_COLUMNS:
+        return (
+            values
+            if isinstance(values.dtype, pd.CategoricalDtype)
+            else values.astype("category")
+        )
+    if name in TIME_COLUMNS:
+        return pd.to_datetime(values)
+    if name in FLOAT64_COLUMNS:
+        return values
+    if values.dtype == np.float64:
+        return values.astype(np.float32)
+    if values.dtype == np.int64:
+        return pd.to_numeric(values, downcast="integer")
+    return values
+
+
+def compact(value):
+    """``value`` with the compact dtypes if it is a frame, else unchanged."""
+    if not COMPACT_FRAMES:
+        return value
+    if isinstance(value, pd.DataFrame):
+        return value.assign(
+            **{
+                str(name): _compact_column(name, value[name])
+                for name in value.columns
+                if isinstance(name, str)
+            }
+        )
+    if isinstance(value, pd.Series) and value.dtype == np.float64:
+        return value if value.name in FLOAT64_COLUMNS else value.astype(np.float32)
+    return value
+
+
+def compacted(func: Callable) -> Callable:
+    """Return ``func``'s frames with the compact dtypes."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return compact(func(*args, **kwargs))
+
+    return wrapper
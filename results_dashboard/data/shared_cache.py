@@ -0,0 +1,167 @@
+"""A result cache in SQLite, shared by every server process on a host.
+
+Frames are stored as Parquet, so categoricals, float32 columns and index
+levels survive the round trip; anything else is pickled. Entries expire
+after their TTL and the least recently used are evicted once the file's
+entries exceed ``max_bytes``. Expiry times are wall-clock, since monotonic
+clocks aren't comparable between processes.
+"""
+import hashlib
+import io
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Hashable
+
+import pandas as pd
+
+# bump when a change alters what cached methods return or how entries are stored
+CACHE_VERSION = 2
+
+
+def _digest(key: Hashable) -> str:
+    """A stable key for ``key``, which must have a deterministic repr."""
+    return hashlib.sha256(f"{CACHE_VERSION}:{key!r}".encode()).hexdigest()
+
+
+def dumps(value: Any) -> tuple[str, bytes]:
+    """Serialize a cached result as ``(format, payload)``."""
+    buffer = io.BytesIO()
+    try:
+        if isinstance(value, pd.DataFrame):
+            value.to_parquet(buffer)
+            return "frame", buffer.getvalue()
+        if isinstance(value, pd.Series):
+            value.to_frame(name=value.name or "value").to_parquet(buffer)
+            return "series", buffer.getvalue()
+    except (TypeError, ValueError, ImportError):
+        # frames Parquet can't hold, e.g. mixed-type object columns
+        pass
+    return "pickle", pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def loads(fmt: str, payload: bytes) -> Any:
+    if fmt == "frame":
+        return pd.read_parquet(io.BytesIO(payload))
+    if fmt == "series":
+        return pd.read_parquet(io.BytesIO(payload)).iloc[:, 0]
+    return pickle.loads(payload)
+
+
+class SQLiteCache:
+    """Cross-process result cache with a TTL per entry and an LRU size bound."""
+
+    def __init__(self, path: Path, max_bytes: int):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        self._stats_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """This thread's connection, creating the database on first use."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            # readers don't block the writer and vice versa
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            (version,) = connection.execute("PRAGMA user_version").fetchone()
+            if version != CACHE_VERSION:
+                # entries of another version can't be read, so start afresh
+                connection.execute("DROP TABLE IF EXISTS entries")
+                connection.execute(f"PRAGMA user_version = {CACHE_VERSION}")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, format TEXT, value BLOB,"
+                " size INTEGER, expires REAL, stored REAL, accessed REAL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def _count(self, stat: str) -> None:
+        with self._stats_lock:
+            self._stats[stat] += 1
+
+    def get(self, key: Hashable) -> tuple[bool, Any, float | None, float | None]:
+        """Return ``(hit, value, expires, stored)`` for a key, dropping it if expired.
+
+        ``expires`` is the entry's wall-clock expiry time, None if it never
+        expires, and ``stored`` the time its value was computed.
+        """
+        digest = _digest(key)
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT format, value, expires, stored FROM entries WHERE key = ?",
+            (digest,),
+        ).fetchone()
+        if row is None:
+            self._count("misses")
+            return False, None, None, None
+
+        fmt, payload, expires, stored = row
+        now = time.time()
+        if expires is not None and expires < now:
+            connection.execute("DELETE FROM entries WHERE key = ?", (digest,))
+            self._count("expirations")
+            self._count("misses")
+            return False, None, None, None
+
+        connection.execute(
+            "UPDATE entries SET accessed = ? WHERE key = ?", (now, digest)
+        )
+        self._count("hits")
+        return True, loads(fmt, payload), expires, stored
+
+    def set(
+        self, key: Hashable, value: Any, ttl: float | None, stored: float | None = None
+    ) -> int:
+        """Store a value for every process. Returns its serialized size.
+
+        ``stored`` is when the value was computed, now if None.
+        """
+        fmt, payload = dumps(value)
+        size = len(payload)
+        if size > self.max_bytes:
+            return size
+
+        now = time.time()
+        expires = None if ttl is None else now + ttl
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (_digest(key), fmt, payload, size, expires, stored or now, now),
+        )
+        self._evict(connection, now)
+        return size
+
+    def _evict(self, connection: sqlite3.Connection, now: float) -> None:
+        connection.execute("DELETE FROM entries WHERE expires < ?", (now,))
+        (total,) = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        while total > self.max_bytes:
+            key, size = connection.execute(
+                "SELECT key, size FROM entries ORDER BY accessed LIMIT 1"
+            ).fetchone()
+            connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            self._count("evictions")
+
+    def clear(self) -> None:
+        self._connection().execute("DELETE FROM entries")
+
+    def stats(self) -> dict[str, int]:
+        entries, size = (
+            self._connection()
+            .execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries")
+            .fetchone()
+        )
+        with self._stats_lock:
+            return {**self._stats, "entries": entries, "bytes": size}
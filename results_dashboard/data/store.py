@@ -0,0 +1,279 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+from bson import ObjectId
+
+from . import perf
+from .decode import CATEGORY, DATETIME, FLOAT
+from .mongo import aggregate, mongo_tilt_db, tests_db
+
+# flattened sample fields kept in the store
+SAMPLE_PROJECTION = {
+    "_id": 1,
+    "sensor_name": 1,
+    "sample_time": 1,
+    "set_angle": "$stage_data.set_angle",
+    "stage_angle": "$stage_data.stage_angle",
+    "oven_set_temperature": "$temperature_data.oven_set_temperature",
+    "oven_integrated_temperature": "$temperature_data.oven_integrated_temperature",
+    "thermocouple_temperature": "$temperature_data.thermocouple_temperature",
+    "ambient_temperature": "$temperature_data.ambient_temperature",
+    "raw": "$sensor_data.raw",
+    "degrees": "$sensor_data.degrees",
+}
+SAMPLE_COLUMNS = [column for column in SAMPLE_PROJECTION if column != "_id"]
+SAMPLE_FIELDS = {column: FLOAT for column in SAMPLE_COLUMNS} | {
+    "sample_time": DATETIME,
+    "sensor_name": CATEGORY,
+}
+# every part is written with this schema, whatever types a chunk's values had,
+# so the parts of a test can always be read back as one dataset
+_ARROW_TYPES = {FLOAT: pa.float64(), DATETIME: pa.timestamp("ms"), CATEGORY: pa.string()}
+SAMPLE_SCHEMA = pa.schema(
+    [(column, _ARROW_TYPES[SAMPLE_FIELDS[column]]) for column in SAMPLE_COLUMNS]
+)
+
+# another process holding a sync lock longer than this is assumed to have died
+STALE_LOCK_SECONDS = 600
+
+logger = logging.getLogger(__name__)
+
+
+class SampleStore:
+    """Parquet files of flattened samples, one directory per test.
+
+    Each sync appends the samples whose ``_id`` is above the stored watermark,
+    so only new rows are fetched for in-progress tests. ObjectIds come from
+    the single test rig writing a test, so they increase with insertion
+    order. Once a test is complete and fully synced it is never queried
+    again.
+
+    Pages only read tests the store holds a current copy of, and schedule a
+    background sync for the others meanwhile. Tests read least recently are
+    removed once the store grows past ``max_bytes``.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        enabled: bool = False,
+        chunk_size: int = 100_000,
+        max_bytes: int = 10 * 2**30,
+        max_lag: float = 60,
+    ):
+        self.path = Path(path)
+        self.enabled = enabled
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        # an in-progress test synced longer ago than this is read from Mongo
+        self.max_lag = max_lag
+        self._locks: dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store")
+        self._scheduled: set[str] = set()
+
+    def _test_dir(self, test_id: str) -> Path:
+        return self.path / str(test_id)
+
+    def _lock(self, test_id: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(str(test_id), threading.Lock())
+
+    def read_meta(self, test_id: str) -> dict:
+        try:
+            with open(self._test_dir(test_id) / "_meta.json") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {
+                "watermark": None,
+                "populated": False,
+                "complete": False,
+                "synced": None,
+            }
+
+    def current(self, test_id: str) -> bool:
+        """Whether the stored copy of a test is complete or recently synced."""
+        meta = self.read_meta(test_id)
+        if not meta["populated"]:
+            return False
+        synced = meta.get("synced")
+        return meta["complete"] or (
+            synced is not None and time.time() - synced <= self.max_lag
+        )
+
+    def sync_later(self, test_id: str) -> None:
+        """Sync a test in the background unless a sync is already scheduled."""
+        test_id = str(test_id)
+        with self._locks_lock:
+            if test_id in self._scheduled:
+                return
+            self._scheduled.add(test_id)
+        self._pool.submit(self._background_sync, test_id)
+
+    def _background_sync(self, test_id: str) -> None:
+        try:
+            self.sync(test_id)
+            self.evict(keep=test_id)
+        except Exception:
+            logger.exception("Syncing test %s to the sample store failed", test_id)
+        finally:
+            with self._locks_lock:
+                self._scheduled.discard(test_id)
+
+    def _write_meta(self, test_id: str, meta: dict) -> None:
+        path = self._test_dir(test_id) / "_meta.json"
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, path)
+
+    def _acquire_file_lock(self, test_id: str) -> bool:
+        """Stop two processes from appending the same samples at once."""
+        path = self._test_dir(test_id) / "_lock"
+        try:
+            if time.time() - path.stat().st_mtime > STALE_LOCK_SECONDS:
+                path.unlink(missing_ok=True)
+        except FileNotFoundError:
+            pass
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL))
+            return True
+        except FileExistsError:
+            return False
+
+    def _release_file_lock(self, test_id: str) -> None:
+        (self._test_dir(test_id) / "_lock").unlink(missing_ok=True)
+
+    def _write_part(self, test_id: str, rows: list[dict]) -> ObjectId:
+        df = pd.DataFrame(rows, columns=["_id"] + SAMPLE_COLUMNS)
+        last_id = df["_id"].iloc[-1]
+        # naming parts by their first _id makes re-fetching a range idempotent
+        path = self._test_dir(test_id) / f"part-{df['_id'].iloc[0]}.parquet"
+        # pyarrow skips dot files when reading the directory
+        tmp = path.with_name(f".{path.name}.tmp")
+        # Mongo dates are whole milliseconds, so the cast to ms loses nothing
+        table = pa.Table.from_pandas(
+            df.drop(columns="_id"),
+            schema=SAMPLE_SCHEMA,
+            preserve_index=False,
+            safe=False,
+        )
+        pq.write_table(table, tmp)
+        os.replace(tmp, path)
+        return last_id
+
+    @perf.instrumented(name="SampleStore.sync")
+    def sync(self, test_id: str) -> bool:
+        """Fetch new samples for a test. Returns whether the store can serve it."""
+        meta = self.read_meta(test_id)
+        if meta["complete"]:
+            return True
+
+        with self._lock(test_id):
+            self._test_dir(test_id).mkdir(parents=True, exist_ok=True)
+            if not self._acquire_file_lock(test_id):
+                return self.read_meta(test_id)["populated"]
+
+            try:
+                meta = self.read_meta(test_id)
+                test = mongo_tilt_db()["test"].find_one(
+                    {"_id": ObjectId(test_id)}, {"status": 1}
+                )
+                complete = tests_db.is_complete(test or {})
+
+                match = {"test_id": ObjectId(test_id)}
+                if meta["watermark"] is not None:
+                    match["_id"] = {"$gt": ObjectId(meta["watermark"])}
+                cursor = aggregate(
+                    "sample",
+                    [
+                        {"$match": match},
+                        {"$sort": {"_id": 1}},
+                        {"$project": SAMPLE_PROJECTION},
+                    ],
+                    allowDiskUse=True,
+                )
+
+                rows = []
+                for row in cursor:
+                    rows.append(row)
+                    if len(rows) >= self.chunk_size:
+                        meta["watermark"] = str(self._write_part(test_id, rows))
+                        self._write_meta(test_id, meta)
+                        rows = []
+                if rows:
+                    meta["watermark"] = str(self._write_part(test_id, rows))
+
+                meta["populated"] = True
+                meta["complete"] = complete
+                meta["synced"] = time.time()
+                self._write_meta(test_id, meta)
+            finally:
+                self._release_file_lock(test_id)
+
+        return True
+
+    def load(
+        self,
+        test_id: str,
+        columns: list[str] | None = None,
+        sensor_mask: list[str] | None = None,
+        time_window: tuple[datetime, datetime] | None = None,
+    ) -> pd.DataFrame:
+        """Read a test's stored samples, optionally limited by sensor and time."""
+        columns = columns or SAMPLE_COLUMNS
+        test_dir = self._test_dir(test_id)
+        if not any(test_dir.glob("part-*.parquet")):
+            return pd.DataFrame(columns=columns)
+
+        # the directory's mtime orders tests for eviction
+        os.utime(test_dir)
+        filters = []
+        if sensor_mask:
+            filters.append(("sensor_name", "in", list(sensor_mask)))
+        if time_window:
+            start, end = time_window
+            filters += [("sample_time", ">=", start), ("sample_time", "<=", end)]
+        return pd.read_parquet(test_dir, columns=columns, filters=filters or None)
+
+    def evict(self, keep: str | None = None) -> None:
+        """Remove the tests read least recently until the store fits ``max_bytes``.
+
+        Tests being synced, and ``keep``, are left alone.
+        """
+        tests = []
+        for test_dir in self.path.iterdir() if self.path.exists() else []:
+            try:
+                size = sum(f.stat().st_size for f in test_dir.glob("part-*.parquet"))
+                tests.append((test_dir.stat().st_mtime, size, test_dir))
+            except FileNotFoundError:
+                continue
+        total = sum(size for _, size, _ in tests)
+        for _, size, test_dir in sorted(tests, key=lambda t: t[0]):
+            if total <= self.max_bytes:
+                break
+            if test_dir.name == keep or (test_dir / "_lock").exists():
+                continue
+            # readers check the metadata first, so drop it before the samples
+            (test_dir / "_meta.json").unlink(missing_ok=True)
+            shutil.rmtree(test_dir, ignore_errors=True)
+            total -= size
+
+
+sample_store = SampleStore(
+    Path(st.secrets.get("sample_store_path", ".sample_store")),
+    enabled=bool(st.secrets.get("sample_store_enabled", False)),
+    max_bytes=int(st.secrets.get("sample_store_max_mb", 10240)) * 2**20,
+    max_lag=float(st.secrets.get("sample_store_max_lag_seconds", 60)),
+)
@@ -1,16 +1,19 @@
 import streamlit as st
 from streamlit_extras.app_logo import add_logo
 
-from results_dashboard.data import SensorData
+from results_dashboard.data import SensorData, perf
 
-from . import samples, test_select
+from . import live, samples, test_select
 
 
-def show_sidebar() -> SensorData:
+def show_sidebar(page: str = "") -> SensorData:
+    perf.start_run(page)
     add_logo(
         "https://frederickscompany.com/wp-content/uploads/2022/12/tfc-logo-round-edge.png"
     )
     st.sidebar.write("### General Options")
     selected_ids = test_select.get_test_selection_sidebar()
     data = samples.show_samples_sidebar(selected_ids)
+    data = live.show_live_sidebar(data)
+    perf.checkpoint("Sidebar")
     return data
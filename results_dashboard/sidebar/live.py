@@ -0,0 +1,45 @@
+import time
+
+import streamlit as st
+
+from ..data import SensorData
+from ..data.catalog import test_catalog
+
+REFRESH_INTERVALS = [5, 10, 30, 60]
+
+
+def show_live_sidebar(data: SensorData) -> SensorData:
+    """Live mode controls, shown while a selected test is still running."""
+    st.session_state["live_active"] = False
+    if not data.test_ids or test_catalog.complete(data.test_ids):
+        return data
+
+    st.sidebar.write("### Live Mode")
+    live = st.sidebar.checkbox(
+        "Follow Running Test",
+        key="live_mode",
+        help="Fetch only new samples on each refresh and update results in place.",
+    )
+    if not live:
+        return data
+
+    st.sidebar.select_slider(
+        "Refresh Every (s)", REFRESH_INTERVALS, value=10, key="live_interval"
+    )
+    new_samples = data.refresh_live()
+    st.sidebar.caption(f"{new_samples:,} new samples")
+    st.session_state["live_active"] = data.live
+    return data
+
+
+def wait_for_refresh() -> None:
+    """Rerun the page after the live refresh interval. Call at the end of a page."""
+    if not st.session_state.get("live_active"):
+        return
+
+    # count down in short sleeps so widget changes still rerun promptly
+    countdown = st.sidebar.empty()
+    for remaining in range(st.session_state["live_interval"], 0, -1):
+        countdown.caption(f"Refreshing in {remaining} s")
+        time.sleep(1)
+    st.experimental_rerun()
@@ -0,0 +1,76 @@
+import time
+
+import pandas as pd
+import streamlit as st
+
+from ..data import perf
+from ..data.mongo import mongo_stats
+
+SHOW_PERFORMANCE = bool(st.secrets.get("show_performance", True))
+
+
+def format_age(seconds: float) -> str:
+    if seconds < 120:
+        return f"{seconds:.0f} s"
+    if seconds < 7200:
+        return f"{seconds / 60:.0f} min"
+    return f"{seconds / 3600:.0f} h"
+
+
+def show_status_generic(namespace) -> None:
+    """Stale results and where this rerun's time went. Call at the end of a page."""
+    run = perf.current_run()
+    if run is None:
+        return
+
+    for notice in dict.fromkeys(s.notice for s in run.spans if s.notice):
+        namespace.warning(notice)
+    stale = [s for s in run.spans if s.cache == "stale"]
+    if stale:
+        namespace.caption(
+            f"Showing results up to {format_age(max(s.age for s in stale))} old "
+            "while they refresh"
+        )
+    if not SHOW_PERFORMANCE:
+        return
+
+    perf.checkpoint("Rest of page")
+    total = time.perf_counter() - run.started
+    spans = [s for s in run.spans if s.kind != "section"]
+    top = [s for s in spans if s.depth == 0]
+    hits = sum(s.cache == "hit" for s in spans)
+    shared = sum(s.cache == "shared" for s in spans)
+    misses = sum(s.cache == "miss" for s in spans)
+
+    expander = namespace.expander("Performance")
+    expander.caption(
+        f"Rerun {total:.2f} s, Mongo {sum(s.mongo_seconds for s in top):.2f} s "
+        f"over {sum(s.round_trips for s in top)} round trips, "
+        f"cache {hits} hits / {shared} shared / {misses} misses"
+    )
+    pool = mongo_stats()
+    expander.caption(
+        f"Mongo connections {pool['connections_opened'] - pool['connections_closed']} "
+        f"open, {pool['connections_opened']} opened, {pool['checkouts']} checkouts "
+        "since the server started"
+    )
+    rows = [
+        {
+            "name": "  " * s.depth + s.name,
+            "kind": s.kind,
+            "seconds": s.seconds,
+            "mongo s": s.mongo_seconds if s.kind != "section" else None,
+            "round trips": s.round_trips if s.kind != "section" else None,
+            "docs": s.docs if s.kind != "section" else None,
+            "rows": s.rows,
+            "MiB": s.bytes / 2**20 if s.bytes is not None else None,
+            "cache": s.cache,
+            "age s": s.age,
+        }
+        for s in run.spans
+    ]
+    expander.dataframe(pd.DataFrame(rows), use_container_width=True)
+
+
+def show_status() -> None:
+    show_status_generic(st.sidebar)
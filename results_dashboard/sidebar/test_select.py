@@ -1,7 +1,9 @@
+import math
 from typing import Literal
 
 import streamlit as st
 
+from ..data.catalog import CATALOG_PAGE_SIZE, test_catalog
 from ..data.mongo import tests_db
 
 
@@ -37,25 +39,34 @@ def show_test_list_sidebar() -> None:
 
 
 def get_test_selection_generic(namespace) -> list[str]:
-    test_list = tests_db.get_tests()
-    test_list = test_list.loc[test_list["rows_written"] > 0, :]
-    try:
-        test_selection = namespace.multiselect(
-            "Select Test(s)",
-            list(test_list["label"]),
-            default=st.session_state["test_selection"],
-            key="test_selection",
-        )
-    except KeyError:
-        test_selection = namespace.multiselect(
-            "Select Test(s)",
-            list(test_list["label"]),
-            key="test_selection",
+    search = namespace.text_input("Search Tests", key="test_search")
+    page_size = CATALOG_PAGE_SIZE
+    pages = max(math.ceil(test_catalog.count(search) / page_size), 1)
+    # keep the page in range when a new search matches fewer tests
+    if st.session_state.get("test_page", 1) > pages:
+        st.session_state["test_page"] = pages
+    page = 1
+    if pages > 1:
+        page = namespace.number_input(
+            f"Page (of {pages})", min_value=1, max_value=pages, key="test_page"
         )
-    selected_ids = test_list.loc[
-        test_list["label"].isin(test_selection), "_id"
-    ].tolist()
-    return selected_ids
+    results = test_catalog.search(search, page - 1, page_size)
+
+    # selected tests stay available while other pages are browsed; options
+    # follow catalog order so picking a test doesn't reorder them
+    selected = st.session_state.setdefault("selected_tests", [])
+    tests = test_catalog.tests(selected + results["_id"].tolist())
+    options = tests["_id"].tolist()
+    if any(test_id not in options for test_id in selected):
+        st.session_state["selected_tests"] = [t for t in selected if t in options]
+    labels = dict(zip(tests["_id"], tests["label"]))
+    namespace.multiselect(
+        "Select Test(s)",
+        options,
+        format_func=lambda test_id: labels.get(test_id) or test_id,
+        key="selected_tests",
+    )
+    return st.session_state["selected_tests"]
 
 
 def get_test_selection() -> list[str]:
@@ -0,0 +1,34 @@
+import datetime
+
+import streamlit as st
+
+from ..data import SensorData
+
+
+def show_time_window_generic(data: SensorData, namespace, key: str) -> SensorData:
+    """Slider for the time window to chart, re-querying the selection inside it.
+
+    Charts are downsampled to a fixed number of points, so narrowing the
+    window shows the samples in it at a finer resolution.
+    """
+    time_range = data.time_range
+    if time_range is None or time_range[0] == time_range[1]:
+        return data
+
+    start, end = time_range
+    window = namespace.slider(
+        "Time Window",
+        min_value=start,
+        max_value=end,
+        value=(start, end),
+        step=datetime.timedelta(minutes=1),
+        format="MM/DD HH:mm",
+        key=key,
+    )
+    if tuple(window) == (start, end):
+        return data
+    return data.windowed(*window)
+
+
+def show_time_window(data: SensorData, key: str) -> SensorData:
+    return show_time_window_generic(data, st, key)
@@ -0,0 +1,58 @@
+from unittest import mock
+
+from results_dashboard.data import perf
+from results_dashboard.data.mongo import aggregate, budgets
+
+
+def aggregate_options(**kwargs) -> dict:
+    """The options ``aggregate`` passes to pymongo."""
+    with mock.patch("results_dashboard.data.mongo.mongo_tilt_db") as db:
+        aggregate("sample", [], **kwargs)
+    return db.return_value["sample"].aggregate.call_args.kwargs
+
+
+def test_no_budget_outside_a_scope():
+    assert budgets.query_options() == {}
+    assert "maxTimeMS" not in aggregate_options()
+    assert "allowDiskUse" not in aggregate_options()
+
+
+def test_default_budget_inside_a_scope():
+    with budgets.budget("SensorData._angle_stats"):
+        options = aggregate_options()
+    assert options["maxTimeMS"] == budgets.QUERY_MAX_TIME_MS
+    assert options["allowDiskUse"] == budgets.QUERY_ALLOW_DISK_USE
+
+
+def test_explicit_options_win():
+    with budgets.budget("SensorData._angle_stats"):
+        assert aggregate_options(allowDiskUse=False)["allowDiskUse"] is False
+
+
+def test_bulk_copies_are_unlimited_inside_a_scope():
+    for name in ("SampleStore.sync", "LiveTail.refresh"):
+        with budgets.budget("SensorData._angle_stats"), perf.span("query", name):
+            assert "maxTimeMS" not in aggregate_options()
+
+
+def test_configured_span_applies_outside_a_scope():
+    config = {"tests_db.get_tests": {"max_time_ms": 5000}}
+    with mock.patch.dict(budgets.QUERY_BUDGETS, config):
+        with perf.span("query", "tests_db.get_tests"):
+            assert aggregate_options()["maxTimeMS"] == 5000
+
+
+def test_cancellable_closes_the_cursor():
+    cursor = mock.MagicMock()
+    cursor.__iter__.return_value = iter([1, 2, 3])
+    cancelled = []
+    with budgets.budget("SensorData._angle_stats", lambda: bool(cancelled)):
+        read = []
+        try:
+            for item in budgets.cancellable(cursor):
+                read.append(item)
+                cancelled.append(True)
+        except budgets.QueryCancelled:
+            pass
+    assert read == [1]
+    cursor.close.assert_called_once()
@@ -0,0 +1,151 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pandas as pd
+
+from results_dashboard.data import cache, perf
+from results_dashboard.data.mongo import budgets
+
+
+class Selection:
+    """The parts of ``SensorData`` that ``cached`` uses."""
+
+    def __init__(self, key):
+        self.cache_key = key
+
+    def cache_ttl(self, ttl):
+        return ttl
+
+
+class Rerun(BaseException):
+    """Stands in for the exception Streamlit raises when a rerun supersedes a page."""
+
+
+def coalesced(flights: cache.SingleFlight, func, callers: int = 8) -> list:
+    """Call ``func`` through ``flights`` from concurrent callers.
+
+    Returns each caller's ``(result, shared)``, or the exception it raised.
+    """
+    barrier = threading.Barrier(callers)
+
+    def call(_):
+        barrier.wait()
+        try:
+            return flights.do("key", func)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(callers) as pool:
+        return list(pool.map(call, range(callers)))
+
+
+def test_single_flight_runs_concurrent_calls_once():
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return "result"
+
+    flights = cache.SingleFlight()
+    results = coalesced(flights, slow)
+    assert len(calls) == 1
+    assert [result for result, _ in results] == ["result"] * len(results)
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+    assert flights.in_flight() == 0 and flights.abandoned("key")
+
+
+def test_single_flight_shares_errors_and_retries():
+    def failing():
+        time.sleep(0.2)
+        raise ValueError("query failed")
+
+    flights = cache.SingleFlight()
+    errors = coalesced(flights, failing)
+    assert all(isinstance(e, ValueError) for e in errors)
+    # a failed call isn't remembered
+    assert flights.do("key", lambda: "ok") == ("ok", False)
+
+
+def test_result_cache_evicts_least_recently_used():
+    frame = pd.DataFrame({"x": range(1000)})
+    size = cache._size_of(frame)
+    results = cache.ResultCache(max_bytes=int(size * 2.5))
+    results.set("a", frame, ttl=None)
+    results.set("b", frame, ttl=None)
+    assert results.get("a")[0]
+    results.set("c", frame, ttl=None)
+
+    assert [results.get(key)[0] for key in "abc"] == [True, False, True]
+    stats = results.stats()
+    assert stats["evictions"] == 1 and stats["entries"] == 2
+    assert stats["bytes"] == 2 * size
+
+
+def test_result_cache_expires_entries():
+    results = cache.ResultCache(max_bytes=2**20)
+    results.set("key", "value", ttl=0.05, stored=123.0)
+    assert results.get("key") == (True, "value", 123.0)
+    time.sleep(0.1)
+    assert results.get("key") == (False, None, None)
+    assert results.stats()["expirations"] == 1
+
+
+def test_result_cache_skips_results_over_budget():
+    results = cache.ResultCache(max_bytes=100)
+    assert results.set("key", "x" * 1000, ttl=None) > 100
+    assert not results.get("key")[0]
+
+
+def test_callers_get_copies_of_cached_frames():
+    class Frames(Selection):
+        @cache.cached(cache=cache.ResultCache(max_bytes=2**20))
+        def load(self):
+            return pd.DataFrame({"x": [1.0, 2.0]})
+
+    data = Frames(("copies", object()))
+    data.load()["x"] = 0.0
+    assert data.load()["x"].tolist() == [1.0, 2.0]
+
+
+def test_interrupted_prefetch_cancels_its_queries():
+    started = threading.Event()
+    cancelled = threading.Event()
+
+    class Slow(Selection):
+        @cache.cached()
+        def load(self):
+            started.set()
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                if budgets.cancelled():
+                    cancelled.set()
+                    budgets.check()
+                time.sleep(0.01)
+
+    def rerun(call, name):
+        started.wait(5)
+        raise Rerun()
+
+    data = Slow(("prefetch", object()))
+    with mock.patch.object(perf, "on_page_thread", return_value=True):
+        with mock.patch.object(cache, "_wait", rerun):
+            with cache.prefetching() as pending:
+                assert data.load() is None
+            try:
+                cache.wait_for(pending)
+            except Rerun:
+                pass
+    assert cancelled.wait(5)
+
+
+def test_expired_budget_marks_are_pruned():
+    with mock.patch.object(cache, "BUDGET_RETRY_SECONDS", 0.05):
+        old, new = ("old", object()), ("new", object())
+        cache._mark_over_budget(old, "too slow")
+        time.sleep(0.1)
+        cache._mark_over_budget(new, "too slow")
+    assert cache._budget_exceeded(new) == "too slow"
+    assert old not in cache._over_budget
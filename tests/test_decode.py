@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+from unittest import mock
+
+import bson
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+
+from results_dashboard.data.decode import CATEGORY, DATETIME, FLOAT, decode_batches
+
+FIELDS = {"sensor_name": CATEGORY, "sample_time": DATETIME, "degrees": FLOAT}
+
+
+def batch(docs: list[dict]) -> bytes:
+    return b"".join(bson.encode(doc) for doc in docs)
+
+
+def samples(count: int, start: int = 0) -> list[dict]:
+    return [
+        {
+            "_id": ObjectId(),
+            "sensor_name": f"A-{i % 3}",
+            "sample_time": datetime(2024, 1, 1) + timedelta(milliseconds=1500 * i),
+            "degrees": i / 7,
+        }
+        for i in range(start, start + count)
+    ]
+
+
+def reference(batches: list[bytes]) -> pd.DataFrame:
+    """What bson.decode_all gives for the same fields."""
+    docs = [doc for raw in batches for doc in bson.decode_all(raw)]
+    return pd.DataFrame(
+        {
+            "sensor_name": [doc.get("sensor_name") for doc in docs],
+            "sample_time": pd.to_datetime(
+                [doc.get("sample_time") for doc in docs]
+            ).astype("datetime64[ns]"),
+            "degrees": np.array([doc.get("degrees") for doc in docs], dtype=float),
+        }
+    )
+
+
+def compare_with_decode_all(batches: list[bytes]) -> int:
+    """Check against ``reference``. Returns how many batches fell back to it."""
+    expected = reference(batches)
+    with mock.patch.object(bson, "decode_all", wraps=bson.decode_all) as decode_all:
+        df = decode_batches(batches, FIELDS)
+    assert isinstance(df["sensor_name"].dtype, pd.CategoricalDtype)
+    pd.testing.assert_series_equal(
+        df["sensor_name"].astype(object).where(df["sensor_name"].notna(), None),
+        expected["sensor_name"],
+    )
+    pd.testing.assert_series_equal(df["sample_time"], expected["sample_time"])
+    pd.testing.assert_series_equal(df["degrees"], expected["degrees"])
+    return decode_all.call_count
+
+
+def test_matches_decode_all_across_batches():
+    batches = [batch(samples(100)), batch(samples(250, 100)), batch([])]
+    assert compare_with_decode_all(batches) == 0
+
+
+def test_missing_null_and_reordered_fields():
+    docs = samples(12)
+    del docs[1]["degrees"]
+    docs[2]["sensor_name"] = None
+    docs[3]["sample_time"] = None
+    docs[4] = {"extra": "x" * 50, **dict(reversed(list(docs[4].items())))}
+    docs[5]["sensor_name"] = "ünïcode ✓"
+    docs[6]["degrees"] = 4
+    docs[7]["degrees"] = bson.Int64(2**40)
+    assert compare_with_decode_all([batch(docs)]) == 0
+
+
+def test_falls_back_to_decode_all():
+    long_key, other_type = samples(10), samples(10, 10)
+    long_key[3] = {"a_key_longer_than_the_key_window_of_32": 1, **long_key[3]}
+    other_type[6]["degrees"] = True
+    batches = [batch(long_key), batch(samples(5, 20)), batch(other_type)]
+    assert compare_with_decode_all(batches) == 2
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pytest
+from bson import ObjectId
+
+from results_dashboard.data import local
+from results_dashboard.data.live import LiveTail
+
+TEST_ID = str(ObjectId())
+
+
+def samples(count: int, start: datetime) -> list[dict]:
+    rng = np.random.default_rng(0)
+    return [
+        {
+            "_id": ObjectId(),
+            "test_id": ObjectId(TEST_ID),
+            "sensor_name": "A-1",
+            "sample_time": start + timedelta(seconds=i),
+            "set_angle": float(i // 10),
+            "stage_angle": float(i // 10),
+            "oven_set_temperature": 25.0,
+            "oven_integrated_temperature": 25 + rng.normal(),
+            "thermocouple_temperature": 24 + rng.normal(),
+            "ambient_temperature": 22 + rng.normal(),
+            "raw": rng.normal(),
+            "degrees": float(i // 10) + rng.normal(scale=0.01),
+        }
+        for i in range(count)
+    ]
+
+
+def refreshed(tail: LiveTail, rows: list[dict]) -> LiveTail:
+    with mock.patch("results_dashboard.data.live.aggregate", return_value=rows):
+        tail.refresh()
+    return tail
+
+
+def test_rebucketed_sums_match_wider_buckets():
+    rows = samples(600, datetime(2024, 1, 1))
+    narrow = refreshed(LiveTail([TEST_ID], None, timedelta(seconds=1)), rows)
+    version = narrow.version
+    narrow.rebucket(timedelta(seconds=30))
+    assert narrow.version > version
+
+    wide = refreshed(LiveTail([TEST_ID], None, timedelta(seconds=30)), rows)
+    pd.testing.assert_frame_equal(narrow.temperature_data(), wide.temperature_data())
+    assert len(wide.temperature_data()) == len(local.TEMPERATURE_SOURCES) * 20
+
+
+def test_rebucket_needs_a_multiple():
+    tail = LiveTail([TEST_ID], None, timedelta(seconds=2))
+    with pytest.raises(ValueError):
+        tail.rebucket(timedelta(seconds=5))
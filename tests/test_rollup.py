@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+from results_dashboard.data.live import _sums
+from results_dashboard.data.rollup import SUMMARY_FIELDS, stats_from_sums
+
+
+def test_means_and_deviations_skip_missing_values():
+    rng = np.random.default_rng(0)
+    samples = pd.DataFrame(
+        {
+            "angle": np.repeat([0.0, 5.0], 50),
+            "sensor_name": "A-1",
+            **{name: rng.normal(size=100) for name in SUMMARY_FIELDS},
+        }
+    )
+    samples.loc[::3, "degrees"] = np.nan
+    samples.loc[::7, "error"] = np.nan
+
+    stats = stats_from_sums(
+        _sums(samples, ["angle", "sensor_name"], list(SUMMARY_FIELDS))
+    ).set_index(["angle", "sensor_name"])
+    expected = samples.groupby(["angle", "sensor_name"])
+
+    assert (stats["count"] == 50).all()
+    for name in SUMMARY_FIELDS:
+        np.testing.assert_allclose(stats[f"mean_{name}"], expected[name].mean())
+        if name != "degrees":
+            np.testing.assert_allclose(stats[f"dev_{name}"], expected[name].std())
@@ -0,0 +1,78 @@
+import time
+
+import pandas as pd
+
+from results_dashboard.data import cache, perf
+from results_dashboard.data.shared_cache import SQLiteCache
+
+
+def wait_until(condition, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_values_round_trip_between_processes(tmp_path):
+    path = tmp_path / "results.sqlite"
+    frame = pd.DataFrame(
+        {"sensor_name": pd.Categorical(["A-1", "A-2"]), "degrees": [0.5, 1.5]}
+    )
+    writer, reader = SQLiteCache(path, 2**20), SQLiteCache(path, 2**20)
+    writer.set(("frame",), frame, ttl=60, stored=1000.0)
+    writer.set(("dict",), {"count": 3}, ttl=None)
+
+    hit, value, expires, stored = reader.get(("frame",))
+    assert hit and stored == 1000.0 and expires > time.time()
+    pd.testing.assert_frame_equal(value, frame)
+    assert reader.get(("dict",))[:3] == (True, {"count": 3}, None)
+    assert not reader.get(("missing",))[0]
+
+
+def test_entries_expire(tmp_path):
+    results = SQLiteCache(tmp_path / "results.sqlite", 2**20)
+    results.set("key", "value", ttl=0.05)
+    time.sleep(0.1)
+    assert results.get("key") == (False, None, None, None)
+    assert results.stats()["expirations"] == 1
+
+
+def test_stale_results_refresh_for_every_process(tmp_path):
+    path = tmp_path / "results.sqlite"
+    computed = []
+
+    def process():
+        """A server process: its own memory cache in front of the shared one."""
+        results = cache.TieredCache(
+            cache.ResultCache(2**20), SQLiteCache(path, 2**20)
+        )
+
+        class Selection:
+            cache_key = ("stale", str(path))
+
+            def cache_ttl(self, ttl):
+                return ttl
+
+            @cache.cached(ttl=0.2, cache=results)
+            def load(self):
+                computed.append(1)
+                return len(computed)
+
+        return Selection()
+
+    def load(selection) -> tuple[int, str]:
+        run = perf.start_run("test")
+        value = selection.load()
+        return value, run.spans[-1].cache
+
+    assert load(process()) == (1, "miss")
+    second = process()
+    assert load(second) == (1, "hit")
+
+    time.sleep(0.3)
+    assert load(second) == (1, "stale")
+    assert wait_until(lambda: len(computed) == 2 and not cache.flights.in_flight())
+    # the refreshed result reaches a process that never saw the stale one
+    assert load(process()) == (2, "hit")
@@ -0,0 +1,85 @@
+import os
+import time
+from datetime import datetime
+
+from bson import ObjectId
+
+from results_dashboard.data.store import SampleStore
+
+
+def stored_test(store: SampleStore, rows: int, **meta) -> str:
+    """Write a test's samples as a sync would, without querying Mongo."""
+    test_id = str(ObjectId())
+    store._test_dir(test_id).mkdir(parents=True)
+    last_id = store._write_part(
+        test_id,
+        [
+            {"_id": ObjectId(), "sensor_name": "A-1", "sample_time": datetime.now()}
+            for _ in range(rows)
+        ],
+    )
+    store._write_meta(
+        test_id,
+        {
+            "watermark": str(last_id),
+            "populated": True,
+            "complete": False,
+            "synced": time.time(),
+            **meta,
+        },
+    )
+    return test_id
+
+
+def test_current(tmp_path):
+    store = SampleStore(tmp_path, max_lag=60)
+    assert not store.current(str(ObjectId()))
+    assert store.current(stored_test(store, 1))
+    assert not store.current(stored_test(store, 1, synced=time.time() - 120))
+    assert store.current(stored_test(store, 1, synced=0, complete=True))
+
+
+def test_evicts_least_recently_read(tmp_path):
+    store = SampleStore(tmp_path)
+    old, read, new = (stored_test(store, 1000) for _ in range(3))
+    for age, test_id in ((300, old), (200, read), (100, new)):
+        stamp = time.time() - age
+        os.utime(store._test_dir(test_id), (stamp, stamp))
+    assert len(store.load(read)) == 1000
+
+    store.max_bytes = sum(
+        f.stat().st_size
+        for test_id in (read, new)
+        for f in store._test_dir(test_id).glob("part-*.parquet")
+    )
+    store.evict()
+    assert not store._test_dir(old).exists()
+    assert store.current(read) and store.current(new)
+
+
+def test_keeps_tests_being_synced(tmp_path):
+    store = SampleStore(tmp_path, max_bytes=0)
+    syncing, kept = stored_test(store, 10), stored_test(store, 10)
+    assert store._acquire_file_lock(syncing)
+    store.evict(keep=kept)
+    assert store.current(syncing) and store.current(kept)
+
+
+def test_parts_share_a_schema(tmp_path):
+    store = SampleStore(tmp_path)
+    test_id = str(ObjectId())
+    store._test_dir(test_id).mkdir(parents=True)
+    for degrees in (1, 1.5, None):
+        store._write_part(
+            test_id,
+            [
+                {
+                    "_id": ObjectId(),
+                    "sensor_name": "A-1",
+                    "sample_time": datetime(2024, 1, 1),
+                    "degrees": degrees,
+                }
+            ],
+        )
+    df = store.load(test_id, sensor_mask=["A-1"])
+    assert df["degrees"].tolist()[:2] == [1.0, 1.5] and df["degrees"].isna().iloc[2]